@@ -1,15 +1,28 @@
 import os
 import json
 import random
-from datetime import datetime
-from flask import Flask, flash, redirect, render_template, request, session
+from datetime import datetime, timedelta, timezone
+from flask import Flask, flash, g, jsonify, redirect, render_template, request, session
 from flask_session import Session
 from werkzeug.security import check_password_hash, generate_password_hash
-from sqlalchemy import func, or_, and_
+from sqlalchemy import or_, and_, exists, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import click
 
 from helpers import apology, login_required
-from models import db, User, Course, UserCoursePreference, SortComparison
+from models import (db, User, Course, UserCoursePreference, SortComparison, RankingState, SQLITE_MAX_INTEGER,
+                    SQLITE_MAX_VARIABLES, add_missing_columns, backfill_course_classification, bump_catalog_version,
+                    get_catalog_version, migrate_json_preferences)
+from catalog_index import RECORD_COLUMNS, VersionPoller, course_record, get_catalog_index
+from candidate_cache import CandidateCache
+from catalog_snapshot import write_catalog_snapshot
+from sampler import WeightedSampler, score_codes
+from geneds import GenEdCatalog
+from eligibility import EligibilityContext, eligibility_clause, eligibility_predicate
+from seen import SeenSet
+from importer import CourseWriter, catalog_files_for, map_catalog_files
+from loading import discover_course, saved_preferences_query
+from ranking import TermRanking, forget_comparison, load_term_rankings, rebuild_rankings, record_comparison
 
 # Configure application
 app = Flask(__name__)
@@ -17,25 +30,88 @@ app = Flask(__name__)
 # Configure session to use filesystem (instead of signed cookies)
 app.config["SESSION_PERMANENT"] = False
 app.config["SESSION_TYPE"] = "filesystem"
+# CLASSCUPID_SESSION_DIR moves the session files out of ./flask_session (the tests use a temporary one)
+if os.environ.get("CLASSCUPID_SESSION_DIR"):
+    app.config["SESSION_FILE_DIR"] = os.environ["CLASSCUPID_SESSION_DIR"]
 Session(app)
 
 # Configure SQLAlchemy
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///classcupid.db"
+# CLASSCUPID_DATABASE_URI points the app at another database (the tests use a temporary one)
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("CLASSCUPID_DATABASE_URI", "sqlite:///classcupid.db")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 db.init_app(app)
 
+# Serve recommendation filters from the in-memory catalog index instead of scanning the courses table
+app.config["CATALOG_INDEX_ENABLED"] = True
+# Discover pre-draws this many cards per user and refills when this few are left
+app.config["DISCOVER_DECK_SIZE"] = 20
+app.config["DISCOVER_DECK_REFILL_AT"] = 2
+# Most cards one /api/discover/next request may return (the client prefetches a few at a time)
+app.config["DISCOVER_API_MAX_CARDS"] = 5
+# Most swipes one /api/swipes batch may carry (record_swipes chunks its upsert under SQLITE_MAX_VARIABLES)
+app.config["DISCOVER_SWIPE_BATCH_MAX"] = 100
+# Candidate pools are cached per preference profile (LRU, bounded by profiles and total course ids)
+app.config["CANDIDATE_CACHE_SIZE"] = 256
+app.config["CANDIDATE_CACHE_MAX_COURSE_IDS"] = 2_000_000
+# How often each worker re-reads the catalog version (bumped by import-courses) to pick up a new catalog
+app.config["CATALOG_VERSION_CHECK_SECONDS"] = 5
+# Memory-mapped by every worker to build its catalog index without scanning the courses table
+CATALOG_SNAPSHOT_PATH = os.path.join(app.instance_path, "catalog.snapshot")
+
+candidate_cache = CandidateCache(app.config["CANDIDATE_CACHE_SIZE"], app.config["CANDIDATE_CACHE_MAX_COURSE_IDS"])
+
+# Gen Ed category -> course code index, loaded from data/json/<year>_<Season>_Geneds.json
+gened_catalog = GenEdCatalog(os.path.join(os.path.dirname(__file__), 'data', 'json'))
+
+# Catalog version this worker serves; Gen Ed files are re-read with every new version,
+# the catalog index and candidate cache swap themselves over on their next use
+catalog_versions = VersionPoller(
+    get_catalog_version,
+    interval=app.config["CATALOG_VERSION_CHECK_SECONDS"],
+    on_change=lambda version: gened_catalog.reload(),
+)
+
 # Create all database tables
 with app.app_context():
+    existing_tables = set(inspect(db.engine).get_table_names())
     db.create_all()
+    # Columns come first: the migrations below load models that select every current column
+    added_columns = add_missing_columns()
+    # Databases created before the classification columns existed get them added and backfilled once
+    if "courses.level" in added_columns or "courses.is_fysemr" in added_columns:
+        backfill_course_classification()
+    # Databases created before ranking state (or its closure bitsets) was stored get it computed once
+    if "ranking_states" not in existing_tables or "ranking_states.closure_bits" in added_columns:
+        rebuild_rankings()
+    # Preferences stored as JSON on users before the user_* tables existed are moved over once
+    if "user_terms" not in existing_tables:
+        migrate_json_preferences()
+
+
+def current_catalog_version():
+    """Return the catalog version, fixed for the rest of the request once read"""
+    if "catalog_version" not in g:
+        g.catalog_version = catalog_versions.current()
+    return g.catalog_version
+
+
+def get_current_user():
+    """
+    Return the logged-in User, loaded once per request and shared by routes and templates.
+    
+    Returns:
+        User object, or None if nobody is logged in or the user no longer exists
+    """
+    if "current_user" not in g:
+        user_id = session.get("user_id")
+        g.current_user = db.session.get(User, user_id) if user_id else None
+    return g.current_user
 
 
 @app.context_processor
 def inject_user():
     """Make current user available to all templates"""
-    if session.get("user_id"):
-        user = User.query.get(session["user_id"])
-        return dict(current_user=user)
-    return dict(current_user=None)
+    return dict(current_user=get_current_user())
 
 
 @app.after_request
@@ -147,7 +223,7 @@ def register():
 @login_required
 def profile():
     """User profile and preferences"""
-    user = User.query.get(session["user_id"])
+    user = get_current_user()
     
     # Handle case where user doesn't exist (e.g., after database recreation)
     if not user:
@@ -164,17 +240,18 @@ def profile():
         requirements = request.form.getlist("requirements")
         schools = request.form.getlist("schools")
         
-        # Update user preferences
-        # Store terms as JSON array
-        user.term_preference = json.dumps(terms) if terms else None
+        # Update user preferences (one row per selected value in the user_* tables)
+        user.set_terms(terms)
         user.affiliation = affiliation
         user.year = year if affiliation == "Harvard College" else None
         # Allow 0 concentrations - user can select only requirements
-        user.concentration_preferences = json.dumps(concentrations) if affiliation == "Harvard College" else None
-        user.requirement_preferences = json.dumps(requirements) if requirements and affiliation == "Harvard College" else None
-        user.school_preferences = json.dumps(schools) if schools and affiliation == "Other" else None
+        user.set_concentrations(concentrations if affiliation == "Harvard College" else [])
+        user.set_requirements(requirements if affiliation == "Harvard College" else [])
+        user.set_schools(schools if affiliation == "Other" else [])
         
         db.session.commit()
+        # Cards drawn for the old preferences no longer apply
+        session.pop("discover_deck", None)
         flash("Preferences saved!")
         return redirect("/discover")
     
@@ -215,98 +292,24 @@ def reset_all():
     # Delete all preferences
     UserCoursePreference.query.filter_by(user_id=user_id).delete()
     
-    # Delete all comparisons
+    # Nothing has been seen anymore
+    user = get_current_user()
+    if user:
+        user.clear_seen_courses()
+    
+    # Delete all comparisons and the rankings computed from them
     SortComparison.query.filter_by(user_id=user_id).delete()
+    RankingState.query.filter_by(user_id=user_id).delete()
     
     db.session.commit()
+    session.pop("discover_deck", None)
     flash("All choices cleared. Start swiping again!")
     return redirect("/discover")
 
 
-def rank_courses_binary_search(courses, comparisons):
-    """
-    Rank courses using binary search insertion sort based on comparisons.
-    Returns a dictionary mapping course_id to rank (0 = best, higher = worse).
-    """
-    if not courses:
-        return {}
-    
-    if len(courses) == 1:
-        return {courses[0].id: 0}
-    
-    # Calculate win counts for each course (used as fallback)
-    course_wins = {}
-    for comp in comparisons:
-        course_wins[comp.winner_course_id] = course_wins.get(comp.winner_course_id, 0) + 1
-        course_wins[comp.loser_course_id] = course_wins.get(comp.loser_course_id, 0) - 1
-    
-    # Build comparison lookup: (course1_id, course2_id) -> True if course1 beats course2
-    comparison_map = {}
-    for comp in comparisons:
-        comparison_map[(comp.winner_course_id, comp.loser_course_id)] = True
-        comparison_map[(comp.loser_course_id, comp.winner_course_id)] = False
-    
-    # Helper function to check if course1 is better than course2
-    def is_better(course1_id, course2_id):
-        # Direct comparison exists
-        if (course1_id, course2_id) in comparison_map:
-            return comparison_map[(course1_id, course2_id)]
-        # Reverse comparison exists
-        if (course2_id, course1_id) in comparison_map:
-            return not comparison_map[(course2_id, course1_id)]
-        # No comparison - use win count difference
-        wins1 = course_wins.get(course1_id, 0)
-        wins2 = course_wins.get(course2_id, 0)
-        if wins1 > wins2:
-            return True
-        elif wins1 < wins2:
-            return False
-        # Equal wins - cannot determine
-        return None
-    
-    # Sort courses by win count first (initial ordering)
-    course_list = sorted(courses, key=lambda c: course_wins.get(c.id, 0), reverse=True)
-    
-    # Build sorted list using binary search insertion
-    sorted_courses = []
-    
-    for course in course_list:
-        low = 0
-        high = len(sorted_courses)
-        
-        while low < high:
-            mid = (low + high) // 2
-            mid_course = sorted_courses[mid]
-            
-            # Check if current course is better than mid course
-            better = is_better(course.id, mid_course.id)
-            
-            if better is True:
-                # Current course is better, insert after mid
-                low = mid + 1
-            elif better is False:
-                # Current course is worse, insert before mid
-                high = mid
-            else:
-                # Equal or no comparison - maintain current position (after mid if equal)
-                low = mid + 1
-        
-        sorted_courses.insert(low, course)
-    
-    # Reverse the list so best courses are first (the binary search builds worst-first)
-    sorted_courses.reverse()
-    
-    # Create rank dictionary (0 = best rank)
-    rankings = {}
-    for rank, course in enumerate(sorted_courses):
-        rankings[course.id] = rank
-    
-    return rankings
-
-
 def get_gened_course_codes_for_categories(selected_categories, term_preferences):
     """
-    Load GenEds JSON and return a set of course codes (genEdCode) for the selected categories.
+    Return the set of course codes (genEdCode) for the selected categories from the GenEds catalog.
     
     Args:
         selected_categories: List of Gen Ed category names (e.g., ["Aesthetics & Culture"])
@@ -333,52 +336,32 @@ def get_gened_course_codes_for_categories(selected_categories, term_preferences)
     elif not isinstance(term_preferences, list):
         return set()  # Invalid input, return empty set
     
-    # Determine which GenEds JSON files to use based on term preferences
-    geneds_files = []
-    if "2026 Spring" in term_preferences:
-        geneds_files.append('data/json/2026_Spring_Geneds.json')
-    if "2025 Fall" in term_preferences:
-        geneds_files.append('data/json/2025_Fall_Geneds.json')
+    # Only the valid Gen Ed categories are looked up in the catalog
+    categories = [category for category in selected_categories if category in valid_gened_categories]
+    if not categories:
+        return gened_course_codes
     
-    try:
-        # Load GenEds JSON files and merge results
-        for geneds_filename in geneds_files:
-            geneds_file_path = os.path.join(os.path.dirname(__file__), geneds_filename)
-            with open(geneds_file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                # Remove JSON comments (/* ... */) and handle placeholders for Spring GenEds file
-                import re
-                # Remove single-line and multi-line comments (/* ... */)
-                content = re.sub(r'/\*.*?\*/', '', content, flags=re.DOTALL)
-                # Remove the "categories" section with placeholders if it exists (not needed for our use case)
-                # We only need the "courses" array
-                content = re.sub(r',\s*"categories"\s*:\s*\{[^}]*\}', '', content, flags=re.DOTALL)
-                geneds_data = json.loads(content)
-            
-            # Get all courses from the JSON
-            courses = geneds_data.get('courses', [])
-            
-            # For each selected category, find matching courses
-            for category in selected_categories:
-                if category not in valid_gened_categories:
-                    continue
-                
-                # Find all courses that have this category
-                for course in courses:
-                    course_categories = course.get('categories', [])
-                    if category in course_categories:
-                        gened_code = course.get('genEdCode', '')
-                        if gened_code:
-                            gened_course_codes.add(gened_code)
-        
-    except Exception as e:
-        # If file can't be loaded, return empty set (fall back to flag-based filtering)
-        print(f"Error loading GenEds JSON: {e}")
-        pass
+    # Served from memory - each term's GenEds file is parsed once and reloaded when it changes
+    gened_course_codes = gened_catalog.codes_for(categories, term_preferences)
     
     return gened_course_codes
 
 
+# Mapping from user-facing school name to catalogSchoolDescription in database
+# Note: GSAS uses "Faculty of Arts & Sciences" with post-query course number filtering
+SCHOOL_TO_CATALOG = {
+    "Graduate School of Arts and Sciences": "Faculty of Arts & Sciences",
+    "Harvard School of Dental Medicine": "School of Dental Medicine",
+    "Harvard T.H. Chan School of Public Health": "Harvard Chan School",
+    "Graduate School of Design": "Graduate School of Design",
+    "Harvard Divinity School": "Harvard Divinity School",
+    "Harvard Graduate School of Education": "Graduate School of Education",
+    "Harvard Kennedy School": "Harvard Kennedy School",
+    "Harvard Law School": "Harvard Law School",
+    "Harvard Medical School": "Harvard Medical School",
+}
+
+
 def filter_courses_for_other_affiliation(query, schools):
     """
     Filter courses for "Other Affiliation" users based on specific school rules.
@@ -395,20 +378,6 @@ def filter_courses_for_other_affiliation(query, schools):
     if not schools:
         return query
     
-    # Mapping from user-facing school name to catalogSchoolDescription in database
-    # Note: GSAS uses "Faculty of Arts & Sciences" with post-query course number filtering
-    SCHOOL_TO_CATALOG = {
-        "Graduate School of Arts and Sciences": "Faculty of Arts & Sciences",
-        "Harvard School of Dental Medicine": "School of Dental Medicine",
-        "Harvard T.H. Chan School of Public Health": "Harvard Chan School",
-        "Graduate School of Design": "Graduate School of Design",
-        "Harvard Divinity School": "Harvard Divinity School",
-        "Harvard Graduate School of Education": "Graduate School of Education",
-        "Harvard Kennedy School": "Harvard Kennedy School",
-        "Harvard Law School": "Harvard Law School",
-        "Harvard Medical School": "Harvard Medical School",
-    }
-    
     school_filters = []
     
     for school in schools:
@@ -424,24 +393,31 @@ def filter_courses_for_other_affiliation(query, schools):
     return query
 
 
-def exclude_tutorials(query):
+def filter_course_ids_for_other_affiliation(index, schools):
     """
-    Helper function to exclude Tutorial courses from a query.
-    Filters out courses with component="Tutorial" or "Tutorial" in title.
+    Index equivalent of filter_courses_for_other_affiliation().
+    
+    Args:
+        index: CatalogIndex instance
+        schools: List of selected school names from user preferences
+    
+    Returns:
+        Set of course ids offered by the selected schools, or None if no school filter applies
     """
-    query = query.filter(
-        or_(
-            Course.course_component.is_(None),
-            Course.course_component != "Tutorial"
-        )
-    )
-    query = query.filter(
-        or_(
-            Course.course_title.is_(None),
-            ~Course.course_title.ilike("%Tutorial%")
-        )
-    )
-    return query
+    if not schools:
+        return None
+    
+    school_ids = None
+    for school in schools:
+        if school == "Harvard Business School":
+            ids = index.ids_for_school_containing("Business School")
+        elif school in SCHOOL_TO_CATALOG:
+            ids = index.ids_for_schools([SCHOOL_TO_CATALOG[school]])
+        else:
+            continue
+        school_ids = ids if school_ids is None else school_ids | ids
+    
+    return school_ids
 
 
 def map_concentration_to_department(concentration):
@@ -471,27 +447,120 @@ def map_concentration_to_department(concentration):
     return concentration_to_department.get(concentration, concentration)
 
 
-def is_fysemr_course(course):
+# Level classes each undergraduate year cannot take
+# (all undergraduates are excluded from Grad_research)
+EXCLUDED_LEVELS_BY_YEAR = {
+    # Freshmen cannot take SpecialSeminar, ReadingResearch, any tutorials, or graduate courses
+    "Freshman": {"ReadingResearch", "SpecialSeminar", "SophomoreTutorial", "JuniorTutorial",
+                 "SeniorTutorial", "Grad_low", "Grad_research"},
+    # Grade-specific tutorials (only appropriate year can take their tutorial)
+    "Sophomore": {"JuniorTutorial", "SeniorTutorial", "Grad_research"},
+    "Junior": {"SophomoreTutorial", "SeniorTutorial", "Grad_research"},
+    "Senior": {"SophomoreTutorial", "JuniorTutorial", "Grad_research"},
+}
+
+# Course number ranges Graduate School of Arts and Sciences users see from FAS
+GSAS_COURSE_NUMBER_RANGES = [(200, 299), (300, 399), (2000, 2999), (3000, 3999)]
+
+
+def excluded_levels_for_year(year):
+    """Return the level classes a Harvard College student in this year cannot take"""
+    return EXCLUDED_LEVELS_BY_YEAR.get(year, {"Grad_research"})
+
+
+def gsas_course_number_rule():
+    """SQL predicate for the Graduate School of Arts and Sciences course number ranges"""
+    fas = SCHOOL_TO_CATALOG["Graduate School of Arts and Sciences"]
+    in_range = or_(*[Course.course_num.between(low, high) for low, high in GSAS_COURSE_NUMBER_RANGES])
+    return or_(
+        Course.catalog_school_description.is_(None),
+        Course.catalog_school_description != fas,
+        in_range
+    )
+
+
+def not_seen_by(user):
+    """SQL anti-join predicate excluding the courses a user has already swiped"""
+    return ~exists().where(and_(
+        UserCoursePreference.user_id == user.id,
+        UserCoursePreference.course_id == Course.id
+    ))
+
+
+def candidate_sampler_for(user, seen_courses):
     """
-    Check if a course is a First Year Seminar (FYSEMR) course.
+    Build the weighted sampler over course ids a user can still be shown.
+
+    The pool before seen courses are removed depends only on the user's profile,
+    so it is cached per profile fingerprint and the user's seen set is subtracted
+    on every call. Every filter in build_candidate_sampler() looks at one course
+    at a time, so removing seen courses afterwards gives the same pool.
     """
-    return course.course_number and course.course_number.startswith("FYSEMR")
+    version = current_catalog_version()
+    fingerprint = user.profile_fingerprint()
+    pool = candidate_cache.get(fingerprint, version)
+    if pool is None:
+        index = None
+        if app.config["CATALOG_INDEX_ENABLED"]:
+            index = get_catalog_index(version, CATALOG_SNAPSHOT_PATH)
+            # Another request may already have swapped in a newer catalog
+            version = index.version
+        sampler = build_candidate_sampler(user, SeenSet(), index)
+        pool = candidate_cache.put(
+            fingerprint, version, WeightedSampler.from_columns([course.id for course in sampler.items], sampler.weights)
+        )
+    # Cached samplers are shared between requests and never modified
+    if not seen_courses:
+        return pool
+    return WeightedSampler(
+        (course_id, weight) for course_id, weight in zip(pool.items, pool.weights) if course_id not in seen_courses
+    )
 
 
-def recommend_course_weighted(user, seen_course_ids):
+def recommend_course_weighted(user, seen_courses):
     """
     Recommend a course using weighted selection based on year and course level.
     Returns a single Course object or None.
     """
-    # Get all eligible courses (filtered but not yet weighted)
-    query = Course.query
-    if seen_course_ids:
-        query = query.filter(~Course.id.in_(seen_course_ids))
-    
-    # Filter by term preference (required - enforced by profile page)
+    course_id = candidate_sampler_for(user, seen_courses).choice()
+
+    # The sampler holds ids - only the chosen card is loaded as a full Course
+    return discover_course(course_id) if course_id is not None else None
+
+
+def draw_course_ids(user, seen_courses, count):
+    """Draw up to count distinct course ids with the weighted algorithm, in display order"""
+    return candidate_sampler_for(user, seen_courses).sample(count)
+
+
+def build_candidate_sampler(user, seen_courses, index=None):
+    """
+    Run the filter and weighting pipeline for a user.
+
+    Args:
+        user: User whose preferences drive the filters
+        seen_courses: SeenSet of courses the user has already swiped
+        index: CatalogIndex to filter in memory, or None to filter with SQL queries
+
+    Returns:
+        WeightedSampler over CourseRecords, possibly empty
+    """
     user_terms = user.get_terms()
-    query = query.filter(Course.term_description.in_(user_terms))
-    
+
+    if index is not None:
+        # Courses in the user's terms that haven't been swiped yet
+        term_course_ids = index.ids_for_terms(user_terms)
+        if seen_courses:
+            term_course_ids = seen_courses.exclude(term_course_ids)
+    else:
+        # Get all eligible courses (filtered but not yet weighted), selecting only the CourseRecord columns
+        query = db.session.query(*RECORD_COLUMNS).filter(Course.is_active)
+        if seen_courses:
+            query = query.filter(not_seen_by(user))
+
+        # Filter by term preference (required - enforced by profile page)
+        query = query.filter(Course.term_description.in_(user_terms))
+
     # Filter by affiliation
     if user.affiliation == "Harvard College":
         year = user.year
@@ -513,52 +582,54 @@ def recommend_course_weighted(user, seen_course_ids):
             # Remove "First Year Seminar" from requirements for normal processing
             requirements = [r for r in requirements if r != "First Year Seminar"]
             
-            # Create a separate query for First Year Seminar courses (catalogSubject = "FYSEMR")
-            # Filter by FYSEMR courses (course_number starts with "FYSEMR")
-            fysemr_query = Course.query
-            if seen_course_ids:
-                fysemr_query = fysemr_query.filter(~Course.id.in_(seen_course_ids))
-            
-            # Filter by term preference (required - enforced by profile page)
-            fysemr_query = fysemr_query.filter(Course.term_description.in_(user_terms))
-            
-            # Filter for FYSEMR courses (course_number starts with "FYSEMR")
-            fysemr_query = fysemr_query.filter(Course.course_number.like("FYSEMR%"))
-            
-            # Get FYSEMR courses (no concentration or level filtering)
-            fysemr_courses = fysemr_query.all()
+            if index is not None:
+                # FYSEMR courses in the user's terms (no concentration or level filtering)
+                fysemr_courses = index.records_for(term_course_ids & index.fysemr_ids)
+            else:
+                # Create a separate query for First Year Seminar courses (catalogSubject = "FYSEMR")
+                fysemr_query = db.session.query(*RECORD_COLUMNS).filter(Course.is_active)
+                if seen_courses:
+                    fysemr_query = fysemr_query.filter(not_seen_by(user))
+                
+                # Filter by term preference (required - enforced by profile page)
+                fysemr_query = fysemr_query.filter(Course.term_description.in_(user_terms))
+                
+                # Filter for FYSEMR courses (indexed flag, course_number starts with "FYSEMR")
+                fysemr_query = fysemr_query.filter(Course.is_fysemr == True)
+                
+                # Get FYSEMR courses (no concentration or level filtering)
+                fysemr_courses = [course_record(row) for row in fysemr_query]
             
             # If First Year Seminar is the ONLY requirement and no concentrations selected,
             # return ONLY FYSEMR courses (don't run the main query which would return everything)
             if not concentrations and not requirements:
-                if not fysemr_courses:
-                    return None
-                return random.choice(fysemr_courses)
+                # Every FYSEMR course is equally likely
+                return WeightedSampler((course, 1) for course in fysemr_courses)
         else:
             fysemr_courses = []
         
         # Build main filter conditions - these will be OR'd together
         # This allows: "Statistics courses OR Aesthetics & Culture Gen Eds OR Arts & Humanities courses"
-        main_filter_conditions = []
+        mapped_departments = []
+        flag_columns = []
         
         # Add concentration filter (department)
         # Map concentration names to actual department names in database
         if concentrations:
             mapped_departments = [map_concentration_to_department(conc) for conc in concentrations]
-            main_filter_conditions.append(Course.department.in_(mapped_departments))
         
         # Filter by requirements (if selected)
         if requirements:
             req_map = {
-                "Science & Technology in Society": Course.science_and_technology_in_society,
-                "Aesthetics & Culture": Course.aesthetics_and_culture,
-                "Ethics & Civics": Course.ethics_and_civics,
-                "Histories, Societies, Individuals": Course.histories_societies_individuals,
-                "Arts and Humanities": Course.arts_and_humanities,
-                "Social Sciences": Course.social_sciences,
-                "Science and Engineering and Applied Science": Course.science_engineering_applied,
-                "Quantitative Reasoning": Course.quantitative_reasoning,
-                "Language Requirement": Course.language_requirement
+                "Science & Technology in Society": "science_and_technology_in_society",
+                "Aesthetics & Culture": "aesthetics_and_culture",
+                "Ethics & Civics": "ethics_and_civics",
+                "Histories, Societies, Individuals": "histories_societies_individuals",
+                "Arts and Humanities": "arts_and_humanities",
+                "Social Sciences": "social_sciences",
+                "Science and Engineering and Applied Science": "science_engineering_applied",
+                "Quantitative Reasoning": "quantitative_reasoning",
+                "Language Requirement": "language_requirement"
             }
             
             # Gen Ed categories that should use specific course codes from GenEds JSON
@@ -578,26 +649,19 @@ def recommend_course_weighted(user, seen_course_ids):
                 gened_course_codes = get_gened_course_codes_for_categories(selected_gened_categories, user_terms)
                 has_gened_codes = len(gened_course_codes) > 0
             
-            # Add Gen Ed course codes to main filter conditions
-            if gened_course_codes:
-                main_filter_conditions.append(Course.course_number.in_(gened_course_codes))
-            elif selected_gened_categories:
+            # Gen Ed course codes are added to the main filter conditions below
+            if not gened_course_codes and selected_gened_categories:
                 # If Gen Ed categories selected but no codes found, use flag-based filtering as fallback
                 for req in selected_gened_categories:
                     if req in req_map:
-                        main_filter_conditions.append(req_map[req] == True)
+                        flag_columns.append(req_map[req])
             
             # Add other requirements (non-Gen Ed) to main filter conditions
             for req in other_requirements:
                 if req in req_map:
                     # Skip language requirement here - handled separately via pattern matching
                     if req != "Language Requirement":
-                        main_filter_conditions.append(req_map[req] == True)
-        
-        # Apply all main filters with OR logic
-        # Result: "concentration courses OR Gen Ed courses OR divisional dist courses"
-        if main_filter_conditions:
-            query = query.filter(or_(*main_filter_conditions))
+                        flag_columns.append(req_map[req])
         
         # Divisional distribution requirements (exclude Tutorials)
         # This must be independent of main_filter_conditions to work correctly
@@ -608,27 +672,70 @@ def recommend_course_weighted(user, seen_course_ids):
         }
         has_divisional_dist = requirements and any(req in divisional_requirements for req in requirements)
         
-        # Exclude Tutorial courses when filtering by divisional distribution
-        if has_divisional_dist:
-            query = exclude_tutorials(query)
-        
-        # Exclude tutorials for freshmen (they can't take any tutorials)
-        # Skip this filtering for Gen Ed courses (they're open to all grades)
-        if not has_gened_codes and year == "Freshman":
-            query = exclude_tutorials(query)
+        # Exclude Tutorial courses when filtering by divisional distribution,
+        # and for freshmen (they can't take any tutorials)
+        # Skip the freshman filtering for Gen Ed courses (they're open to all grades)
         # Note: First Year Seminars are handled via weighting (weight=0 for non-freshmen)
+        should_exclude_tutorials = has_divisional_dist or (not has_gened_codes and year == "Freshman")
         
         # Note: Graduate courses are no longer excluded - they're just weighted smaller
         
-        # Get all eligible courses
-        # Note: We need all courses for the weighting algorithm to work correctly.
-        # Add a safety limit to prevent memory issues with overly broad filters.
-        MAX_COURSES = 20000
-        eligible_courses = query.limit(MAX_COURSES).all()
+        # Grade-level, tutorial and language rules from the eligibility rule table (see eligibility.py)
+        context = EligibilityContext(
+            year=year,
+            # Level classes this year can never take (tutorials for other years, Grad_research, ...)
+            excluded_levels=excluded_levels_for_year(year),
+            exclude_tutorials=should_exclude_tutorials,
+            language_requirement=bool(has_language_req),
+            gened_course_codes=gened_course_codes if has_gened_codes else set(),
+        )
         
-        if len(eligible_courses) >= MAX_COURSES:
-            # If we hit the limit, the filters may be too broad - log a warning
-            print(f"Warning: Query returned {MAX_COURSES} courses (limit reached). Consider refining filters.")
+        if index is not None:
+            # Resolve the OR'd filter conditions with set operations on the index postings
+            eligible_ids = term_course_ids
+            if mapped_departments or gened_course_codes or flag_columns:
+                main_ids = index.ids_for_departments(mapped_departments)
+                main_ids |= index.ids_for_course_numbers(gened_course_codes)
+                for column in flag_columns:
+                    main_ids |= index.ids_for_flag(column)
+                eligible_ids = eligible_ids & main_ids
+            
+            # The rule table compiled to an in-memory test on the index records
+            keep = eligibility_predicate(context)
+            eligible_courses = index.records_for(eligible_ids)
+            if keep is not None:
+                eligible_courses = [course for course in eligible_courses if keep(course)]
+        else:
+            main_filter_conditions = []
+            if mapped_departments:
+                main_filter_conditions.append(Course.department.in_(mapped_departments))
+            if gened_course_codes:
+                main_filter_conditions.append(Course.course_number.in_(gened_course_codes))
+            for column in flag_columns:
+                main_filter_conditions.append(getattr(Course, column) == True)
+            
+            # Apply all main filters with OR logic
+            # Result: "concentration courses OR Gen Ed courses OR divisional dist courses"
+            if main_filter_conditions:
+                query = query.filter(or_(*main_filter_conditions))
+            
+            # The rule table compiled to one WHERE clause, so only eligible rows leave the database
+            query = query.filter(eligibility_clause(context))
+            
+            # Get all eligible courses
+            # Note: We need all courses for the weighting algorithm to work correctly.
+            # Add a safety limit to prevent memory issues with overly broad filters.
+            MAX_COURSES = 20000
+            eligible_courses = [course_record(row) for row in query.limit(MAX_COURSES)]
+            
+            if len(eligible_courses) >= MAX_COURSES:
+                # If we hit the limit, the filters may be too broad - log a warning
+                print(f"Warning: Query returned {MAX_COURSES} courses (limit reached). Consider refining filters.")
+            
+            # Rules SQL can't express are checked on the rows
+            keep = eligibility_predicate(context, sql_compiled=True)
+            if keep is not None:
+                eligible_courses = [course for course in eligible_courses if keep(course)]
         
         # Combine FYSEMR courses with eligible courses (union logic)
         # If First Year Seminar is selected, include FYSEMR courses regardless of concentration
@@ -639,234 +746,221 @@ def recommend_course_weighted(user, seen_course_ids):
                 if fysemr_course.id not in eligible_course_ids:
                     eligible_courses.append(fysemr_course)
         
-        if not eligible_courses:
-            return None
-        
-        # Filter out grade-inappropriate tutorials and reading research
-        # Skip all grade-level filtering for Gen Ed courses (they're open to all grades)
-        filtered_courses = []
-        for course in eligible_courses:
-            # Let FYSEMR courses pass through to weighting (handled there via weight=0 for non-freshmen)
-            if is_fysemr_course(course):
-                filtered_courses.append(course)
-                continue
-            # Check if this is a Gen Ed course - if so, skip all grade-level filtering
-            is_gened_course = has_gened_codes and course.course_number in gened_course_codes
-            
-            if not is_gened_course:
-                level = course.classify_level()
-                
-                # Rule: Freshmen cannot take SpecialSeminar, ReadingResearch, or any tutorials
-                if year == "Freshman" and level in ["ReadingResearch", "SpecialSeminar", "SophomoreTutorial", "JuniorTutorial", "SeniorTutorial"]:
-                    continue
-                
-                # Rule: Freshmen cannot take Grad_low or Grad_research courses
-                if year == "Freshman" and level in ["Grad_low", "Grad_research"]:
-                    continue
-                
-                # Rule: Grade-specific tutorials (only appropriate year can take their tutorial)
-                if year == "Sophomore" and level in ["JuniorTutorial", "SeniorTutorial"]:
-                    continue
-                elif year == "Junior" and level in ["SophomoreTutorial", "SeniorTutorial"]:
-                    continue
-                elif year == "Senior" and level in ["SophomoreTutorial", "JuniorTutorial"]:
-                    continue
-                
-                # Rule: All undergraduates cannot take Grad_research courses
-                if level == "Grad_research":
-                    continue
-                
-                # Rule: Exclude any course with "Tutorial" in the title for freshmen
-                if year == "Freshman" and course.course_title and "Tutorial" in course.course_title:
-                    continue
-            
-            # Rule: For language requirement, only show introductory language courses (levels 1, 2, 3, A, B)
-            if has_language_req:
-                # Check if this is a language course (by flag or by course number pattern)
-                is_language_course = False
-                
-                # First check if the course has the language_requirement flag set
-                if course.language_requirement:
-                    is_language_course = True
-                else:
-                    # Identify language courses by course number pattern
-                    # Language courses typically have course numbers like "FRENCH 1", "SPANISH A", etc.
-                    if course.course_number:
-                        course_num_upper = course.course_number.upper()
-                        # Common language department prefixes
-                        language_prefixes = [
-                            'FRENCH', 'SPANISH', 'ITALIAN', 'PORTUGUESE', 'GERMAN', 'CHINESE', 'JAPANESE',
-                            'KOREAN', 'ARABIC', 'HEBREW', 'RUSSIAN', 'LATIN', 'GREEK', 'SANSKRIT',
-                            'SWAHILI', 'YIDDISH', 'VIETNAMESE', 'THAI', 'HINDI', 'URDU', 'TURKISH',
-                            'POLISH', 'CZECH', 'UKRAINIAN', 'SWEDISH', 'NORWEGIAN', 'DANISH', 'FINNISH',
-                            'DUTCH', 'INDONESIAN', 'TAGALOG', 'AMHARIC', 'BENGALI', 'PERSIAN', 'TAMIL'
-                        ]
-                        # Check if course number starts with a language prefix
-                        for prefix in language_prefixes:
-                            if course_num_upper.startswith(prefix):
-                                is_language_course = True
-                                break
-                
-                # If it's a language course, filter for introductory levels only
-                if is_language_course:
-                    course_num = course.extract_course_number()
-                    # Check if course number is A or B
-                    is_letter_intro = False
-                    if course.course_number:
-                        parts = course.course_number.strip().split()
-                        if parts and len(parts) > 1:
-                            last_part = parts[-1].upper()
-                            # Check for A, B, AA, BA patterns (introductory letter courses)
-                            if last_part in ['A', 'B', 'AA', 'BA']:
-                                is_letter_intro = True
-                    
-                    # Only include courses with course numbers 1, 2, 3, A, B, AA, or BA
-                    if not is_letter_intro and (course_num is None or course_num not in [1, 2, 3]):
-                        continue
-                elif has_language_req:
-                    # If language requirement is selected but this isn't a language course, exclude it
-                    continue
-            
-            filtered_courses.append(course)
-        
-        if not filtered_courses:
-            return None
-        
-        # Weight courses based on year and level
-        weighted_pool = []
-        year_lower = year.lower() if year else None
-        
-        for course in filtered_courses:
-            level = course.classify_level()
-            weight = 0
-            
-            if year_lower == "freshman":
-                # Handle FYSEMR courses: only freshmen get weight
-                # Lower weight (1) to prevent FYSEMR courses from dominating when many are available
-                if is_fysemr_course(course):
-                    weight = 1  # Lower weight for better variety with other course types
-                elif level == "UG_intro":
-                    weight = 8  # Heavy on UG_intro (1-99, 1000-1099)
-                elif level == "UG_mid":
-                    weight = 2  # Moderate weight on UG_mid (100-199, 1100-1999)
-                elif level == "Alpha":
-                    weight = 2  # Alpha courses available to all
-                # NO Grad_low or Grad_research for freshmen
-                # NO tutorials, special seminars, or reading research for freshmen
-            
-            elif year_lower == "sophomore":
-                # Non-freshmen get weight 0 for FYSEMR courses (not added to pool)
-                if is_fysemr_course(course):
-                    weight = 0  # Skip FYSEMR courses for non-freshmen
-                elif level == "UG_intro":
-                    weight = 5  # Less highly than freshmen, but not too low
-                elif level == "UG_mid":
-                    weight = 5  # More highly than UG_intro
-                elif level == "SophomoreTutorial":  # 97, 970
-                    weight = 2
-                elif level == "SpecialSeminar":  # 96, 960
-                    weight = 2
-                elif level == "ReadingResearch":  # 91, 910
-                    weight = 2
-                elif level == "Alpha":
-                    weight = 2  # Same across all years
-                # NO Grad_low or Grad_research for sophomores
-            
-            elif year_lower == "junior":
-                # Non-freshmen get weight 0 for FYSEMR courses (not added to pool)
-                if is_fysemr_course(course):
-                    weight = 0  # Skip FYSEMR courses for non-freshmen
-                elif level == "UG_intro":
-                    weight = 2  # Very low
-                elif level == "UG_mid":
-                    weight = 8  # Highly (more than sophomores)
-                elif level == "Grad_low":  # 200-299, 2000-2999
-                    weight = 3  # Moderately (higher than UG_intro but lower than UG_mid)
-                elif level == "JuniorTutorial":  # 98, 980
-                    weight = 2
-                elif level == "SpecialSeminar":  # 96, 960
-                    weight = 2
-                elif level == "ReadingResearch":  # 91, 910
-                    weight = 2
-                elif level == "Alpha":
-                    weight = 2  # Same across all years
-                # NO Grad_research for juniors
-            
-            elif year_lower == "senior":
-                # Non-freshmen get weight 0 for FYSEMR courses (not added to pool)
-                if is_fysemr_course(course):
-                    weight = 0  # Skip FYSEMR courses for non-freshmen
-                elif level == "UG_intro":
-                    weight = 1  # Very low (lowest of all years, practically never display)
-                elif level == "UG_mid":
-                    weight = 7  # Highly (more than juniors)
-                elif level == "Grad_low":  # 200-299, 2000-2999
-                    weight = 6  # Highly (more than juniors)
-                elif level == "SeniorTutorial":  # 99, 990
-                    weight = 2
-                elif level == "SpecialSeminar":  # 96, 960
-                    weight = 2
-                elif level == "ReadingResearch":  # 91, 910
-                    weight = 2
-                elif level == "Alpha":
-                    weight = 2  # Same across all years
-                # NO Grad_research for seniors
-            
-            # Add course to pool with its weight
-            if weight > 0:
-                weighted_pool.extend([course] * weight)
-        
-        # Select random course from weighted pool
-        if weighted_pool:
-            return random.choice(weighted_pool)
-        return None
+        # Weight courses based on year and level (see sampler.YEAR_LEVEL_WEIGHTS), one gather over the
+        # year's weight vector. Non-freshmen get weight 0 for FYSEMR courses, so they never leave the sampler
+        (weights,) = score_codes([course.weight_code for course in eligible_courses], [year])
+        return WeightedSampler.from_columns(eligible_courses, weights)
     
     elif user.affiliation == "Other":
         # Use completely different algorithm for Other Affiliation users
         schools = user.get_schools()
         if not schools:
-            return None
+            return WeightedSampler([])
         
-        # Apply school-specific filtering (this filters by catalogSchoolDescription based on selected schools)
-        query = filter_courses_for_other_affiliation(query, schools)
+        # Graduate School of Arts and Sciences only shows FAS courses numbered
+        # 200-299, 300-399, 2000-2999 or 3000-3999 (courses from other selected schools are all included)
+        has_gsas = "Graduate School of Arts and Sciences" in schools
         
-        # Get all eligible courses after initial filtering (excludes seen courses and filters by school)
-        eligible_courses = query.all()
-        
-        # Post-query filtering for Graduate School of Arts and Sciences (course number ranges)
-        if "Graduate School of Arts and Sciences" in schools:
-            filtered_courses = []
-            for course in eligible_courses:
-                # Only filter courses that are from Faculty of Arts & Sciences by course number
-                if course.catalog_school_description == "Faculty of Arts & Sciences":
-                    course_num = course.extract_course_number()
-                    if course_num is not None:
-                        # Check if course number is in allowed ranges: 300-399, 3000-3999, 200-299, 2000-2999
-                        if ((200 <= course_num <= 299) or 
-                            (300 <= course_num <= 399) or
-                            (2000 <= course_num <= 2999) or
-                            (3000 <= course_num <= 3999)):
-                            filtered_courses.append(course)
-                    # If course number cannot be extracted, skip FAS courses
-                else:
-                    # For courses from other selected schools, include them all
-                    filtered_courses.append(course)
-            eligible_courses = filtered_courses
+        if index is not None:
+            # Apply school-specific filtering on the index postings
+            school_ids = filter_course_ids_for_other_affiliation(index, schools)
+            eligible_ids = term_course_ids if school_ids is None else term_course_ids & school_ids
+            if has_gsas:
+                fas_ids = index.ids_for_schools([SCHOOL_TO_CATALOG["Graduate School of Arts and Sciences"]])
+                eligible_ids -= fas_ids - index.ids_for_course_num_ranges(GSAS_COURSE_NUMBER_RANGES)
+            eligible_courses = index.records_for(eligible_ids)
+        else:
+            # Apply school-specific filtering (this filters by catalogSchoolDescription based on selected schools)
+            query = filter_courses_for_other_affiliation(query, schools)
+            if has_gsas:
+                query = query.filter(gsas_course_number_rule())
+            
+            # Get all eligible courses after initial filtering (excludes seen courses and filters by school)
+            eligible_courses = [course_record(row) for row in query]
         
-        # Return a random course from the filtered eligible courses
-        # This course will be displayed on the discover page
-        if eligible_courses:
-            return random.choice(eligible_courses)
-        return None
+        # Every eligible course is equally likely (no year-based weighting)
+        return WeightedSampler.from_columns(eligible_courses, [1] * len(eligible_courses))
+    
+    return WeightedSampler([])
+
+
+def discover_profile_problem(user):
+    """
+    Check that the user's profile has what discovery needs.
     
+    Returns:
+        Message telling the user what to fill in, or None if the profile is complete
+    """
+    # Check if user has set preferences
+    if not user.affiliation:
+        return "Please set your preferences first!"
+    
+    # Check if term preference is set
+    if not user.get_terms():
+        return "Please select at least one term preference first!"
+    
+    # Check if profile is complete based on affiliation
+    if user.affiliation == "Harvard College":
+        # Allow 0 concentrations - user can select divisional distribution only
+        if not user.year:
+            return "Please complete your profile preferences first!"
+    elif user.affiliation == "Other":
+        if not user.get_schools():
+            return "Please complete your profile preferences first!"
+    return None
+
+
+def record_swipe(user, course_id, action):
+    """
+    Create or update the user's preference for a course (caller commits).
+    
+    Goes through record_swipes(), so a swipe leaves the same row whichever endpoint received it.
+    
+    Args:
+        user: User who swiped
+        course_id: Course swiped
+        action: 'heart', 'star' or 'discard'
+    """
+    record_swipes(user, [(course_id, action)])
+
+
+def swipe_problem(course_id, action):
+    """Validate a swipe from the JSON API; returns an error message or None"""
+    if not isinstance(course_id, int) or isinstance(course_id, bool) or not action:
+        return "missing course_id or action"
+    if not 0 < course_id <= SQLITE_MAX_INTEGER:
+        return "invalid course_id"
+    if action not in ['heart', 'star', 'discard']:
+        return "invalid action"
     return None
 
 
+def unknown_course_ids(course_ids):
+    """Return the ids from course_ids that have no course row (one IN query)"""
+    course_ids = set(course_ids)
+    known = {row.id for row in db.session.query(Course.id).filter(Course.id.in_(course_ids))}
+    return course_ids - known
+
+
+def record_swipes(user, swipes):
+    """
+    Apply a burst of swipes with INSERT ... ON CONFLICT(user_id, course_id) DO UPDATE (caller commits).
+    
+    A batch takes one statement unless it would exceed SQLITE_MAX_VARIABLES bound parameters.
+    
+    Swipes get increasing timestamps in the order given, so /discover/undo (newest
+    timestamp first) undoes the last one. A course swiped again takes the new action
+    and timestamp, including a repeat within the same batch.
+    
+    Args:
+        user: User who swiped
+        swipes: List of (course_id, action) in the order they were made
+    """
+    if not swipes:
+        return
+    now = datetime.now(timezone.utc)
+    rows = [
+        {"user_id": user.id, "course_id": course_id, "status": action,
+         "timestamp": now + timedelta(microseconds=position)}
+        for position, (course_id, action) in enumerate(swipes)
+    ]
+    rows_per_statement = SQLITE_MAX_VARIABLES // len(rows[0])
+    for start in range(0, len(rows), rows_per_statement):
+        stmt = sqlite_insert(UserCoursePreference.__table__).values(rows[start:start + rows_per_statement])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "course_id"],
+            set_={"status": stmt.excluded.status, "timestamp": stmt.excluded.timestamp}
+        )
+        db.session.execute(stmt)
+    
+    # Keep the seen bitmap in sync (one update for the whole batch)
+    user.mark_courses_seen(course_id for course_id, _ in swipes)
+
+
+def course_card(course):
+    """Compact JSON payload for one discover card (the fields discover.html renders)"""
+    return {
+        "id": course.id,
+        "course_number": course.course_number,
+        "course_title": course.course_title,
+        "instructor_name": course.instructor_name,
+        "course_url": course.course_url,
+        "description": course.description,
+        "term_description": course.term_description,
+        "department": course.department,
+        "start_time": course.start_time,
+        "end_time": course.end_time,
+        "days": [day for day in ["Su", "M", "T", "W", "Th", "F", "S"] if course.has_day(day)],
+    }
+
+
+def next_courses_from_deck(user, seen_courses, count=1):
+    """
+    Pop the next courses from the user's pre-drawn deck, refilling it in bulk when it runs low.
+    
+    The deck lives in the server-side session and is keyed by user id and profile
+    fingerprint, so a profile change starts a new deck.
+    
+    Args:
+        user: User object
+        seen_courses: SeenSet of course ids the user has swiped
+        count: Number of courses to pop
+    
+    Returns:
+        List of up to count Course objects (fewer if the eligible courses run out)
+    """
+    fingerprint = user.profile_fingerprint()
+    deck = session.get("discover_deck")
+    if not deck or deck.get("user_id") != user.id or deck.get("fingerprint") != fingerprint:
+        deck = {"user_id": user.id, "fingerprint": fingerprint, "course_ids": []}
+    
+    course_ids = list(deck["course_ids"])
+    user_terms = user.get_terms()
+    courses = []
+    refilled = False
+    while len(courses) < count:
+        if len(course_ids) <= app.config["DISCOVER_DECK_REFILL_AT"] and not refilled:
+            # Draw the next batch, skipping seen courses and courses already in the deck
+            excluded = SeenSet(seen_courses.to_bytes())
+            for course_id in course_ids:
+                excluded.add(course_id)
+            # One refill per call, so it has to cover the whole count
+            wanted = max(app.config["DISCOVER_DECK_SIZE"], count - len(courses) + len(course_ids)) - len(course_ids)
+            drawn = draw_course_ids(user, excluded, wanted)
+            course_ids.extend(course_id for course_id in drawn if course_id not in course_ids)
+            refilled = True
+        if not course_ids:
+            break
+        
+        # Skip courses swiped since they were drawn (e.g., in another tab)
+        course_id = course_ids.pop(0)
+        if course_id in seen_courses:
+            continue
+        candidate = discover_course(course_id)
+        if candidate and candidate.is_active and candidate.term_description in user_terms:
+            courses.append(candidate)
+    
+    deck["course_ids"] = course_ids
+    session["discover_deck"] = deck
+    return courses
+
+
+def next_course_from_deck(user, seen_courses):
+    """
+    Pop the next course from the user's pre-drawn deck (see next_courses_from_deck).
+    
+    Returns:
+        Course object or None if no eligible course is left
+    """
+    courses = next_courses_from_deck(user, seen_courses)
+    return courses[0] if courses else None
+
+
 @app.route("/discover")
 @login_required
 def discover():
     """Tinder-style course discovery page with weighted recommendation algorithm"""
-    user = User.query.get(session["user_id"])
+    user = get_current_user()
     
     # Handle case where user doesn't exist (e.g., after database recreation)
     if not user:
@@ -874,32 +968,17 @@ def discover():
         flash("Your session has expired. Please log in again.", "error")
         return redirect("/login")
     
-    # Check if user has set preferences
-    if not user.affiliation:
-        flash("Please set your preferences first!")
+    # Send users without a complete profile to the profile page
+    problem = discover_profile_problem(user)
+    if problem:
+        flash(problem)
         return redirect("/profile")
-    
-    # Check if term preference is set
     user_terms = user.get_terms()
-    if not user_terms:
-        flash("Please select at least one term preference first!")
-        return redirect("/profile")
-    
-    # Check if profile is complete based on affiliation
-    if user.affiliation == "Harvard College":
-        if not user.year:
-            flash("Please complete your profile preferences first!")
-            return redirect("/profile")
-        # Allow 0 concentrations - user can select divisional distribution only
-    elif user.affiliation == "Other":
-        if not user.school_preferences:
-            flash("Please complete your profile preferences first!")
-            return redirect("/profile")
     
     # Check if we should show a specific course (e.g., after undo)
     show_course_id = request.args.get("show_course", type=int)
     if show_course_id:
-        course = Course.query.get(show_course_id)
+        course = discover_course(show_course_id)
         if course:
             # Verify the course matches user's term preferences
             if user_terms and course.term_description not in user_terms:
@@ -908,13 +987,13 @@ def discover():
                 return render_template("discover.html", course=course, is_first_visit=False)
     
     # Get courses user has already seen
-    seen_course_ids = [p.course_id for p in UserCoursePreference.query.filter_by(user_id=user.id).all()]
+    seen_courses = user.get_seen_courses()
     
     # Check if this is the user's first visit (no previous interactions)
-    is_first_visit = len(seen_course_ids) == 0
+    is_first_visit = not seen_courses
     
-    # Use weighted recommendation algorithm
-    course = recommend_course_weighted(user, seen_course_ids)
+    # Use weighted recommendation algorithm (pre-drawn in batches, see next_course_from_deck)
+    course = next_course_from_deck(user, seen_courses)
     
     # If no course found, check if user has saved courses and show appropriate message
     if not course:
@@ -951,7 +1030,14 @@ def discover():
 @login_required
 def swipe():
     """Handle course swipe action (heart, star, discard)"""
-    user_id = session["user_id"]
+    user = get_current_user()
+    
+    # Handle case where user doesn't exist (e.g., after database recreation)
+    if not user:
+        session.clear()
+        flash("Your session has expired. Please log in again.", "error")
+        return redirect("/login")
+    
     course_id = request.form.get("course_id", type=int)
     action = request.form.get("action")  # 'heart', 'star', 'discard'
     
@@ -961,30 +1047,102 @@ def swipe():
     if action not in ['heart', 'star', 'discard']:
         return apology("invalid action", 400)
     
-    # Check if preference already exists
-    preference = UserCoursePreference.query.filter_by(
-        user_id=user_id, 
-        course_id=course_id
-    ).first()
-    
-    if preference:
-        # Update existing preference
-        preference.status = action
-    else:
-        # Create new preference
-        preference = UserCoursePreference(
-            user_id=user_id,
-            course_id=course_id,
-            status=action
-        )
-        db.session.add(preference)
+    if not 0 < course_id <= SQLITE_MAX_INTEGER or db.session.get(Course, course_id) is None:
+        return apology("unknown course", 400)
     
+    record_swipe(user, course_id, action)
     db.session.commit()
     
     # Redirect to next course
     return redirect("/discover")
 
 
+@app.route("/api/discover/next")
+@login_required
+def api_discover_next():
+    """
+    JSON: the next n cards from the user's deck (?n=K, at most DISCOVER_API_MAX_CARDS).
+    
+    main.js keeps a few of these queued so the next card shows without a page load.
+    An empty list means the deck is exhausted; the client then loads /discover for the message.
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify(error="session expired"), 401
+    if discover_profile_problem(user):
+        return jsonify(error="profile incomplete"), 409
+    
+    count = request.args.get("n", default=1, type=int)
+    count = max(1, min(count, app.config["DISCOVER_API_MAX_CARDS"]))
+    courses = next_courses_from_deck(user, user.get_seen_courses(), count)
+    return jsonify(cards=[course_card(course) for course in courses])
+
+
+@app.route("/api/swipe", methods=["POST"])
+@login_required
+def api_swipe():
+    """JSON version of /swipe: record one swipe ({course_id, action}) without rendering the next card"""
+    user = get_current_user()
+    if not user:
+        return jsonify(error="session expired"), 401
+    
+    data = request.get_json(silent=True) or {}
+    course_id = data.get("course_id")
+    action = data.get("action")
+    
+    problem = swipe_problem(course_id, action)
+    if not problem and unknown_course_ids([course_id]):
+        problem = "unknown course_id"
+    if problem:
+        return jsonify(error=problem), 400
+    
+    record_swipe(user, course_id, action)
+    db.session.commit()
+    return jsonify(ok=True)
+
+
+@app.route("/api/swipes", methods=["POST"])
+@login_required
+def api_swipes():
+    """
+    JSON: record a burst of swipes in one transaction.
+    
+    The body is {"swipes": [{"course_id", "action", "client_ts"}, ...]}, with client_ts
+    the client's (monotonic) time of the swipe in milliseconds. The whole batch is
+    rejected if any swipe is invalid.
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify(error="session expired"), 401
+    
+    data = request.get_json(silent=True) or {}
+    items = data.get("swipes")
+    if not isinstance(items, list) or not items:
+        return jsonify(error="missing swipes"), 400
+    if len(items) > app.config["DISCOVER_SWIPE_BATCH_MAX"]:
+        return jsonify(error="too many swipes"), 413
+    
+    swipes = []
+    for item in items:
+        if not isinstance(item, dict):
+            return jsonify(error="invalid swipe"), 400
+        problem = swipe_problem(item.get("course_id"), item.get("action"))
+        client_ts = item.get("client_ts")
+        if not problem and (not isinstance(client_ts, (int, float)) or isinstance(client_ts, bool)):
+            problem = "missing client_ts"
+        if problem:
+            return jsonify(error=problem), 400
+        swipes.append((client_ts, item["course_id"], item["action"]))
+    if unknown_course_ids(course_id for _, course_id, _ in swipes):
+        return jsonify(error="unknown course_id"), 400
+    
+    # Apply in the order the swipes were made (the sort is stable, so ties keep list order)
+    swipes.sort(key=lambda swipe: swipe[0])
+    record_swipes(user, [(course_id, action) for _, course_id, action in swipes])
+    db.session.commit()
+    return jsonify(ok=True, recorded=len(swipes))
+
+
 @app.route("/discover/undo", methods=["POST"])
 @login_required
 def discover_undo():
@@ -1000,6 +1158,15 @@ def discover_undo():
         # Store the course_id before deleting
         course_id_to_show = last_preference.course_id
         db.session.delete(last_preference)
+        # Put the undone course back on top of the deck
+        deck = session.get("discover_deck")
+        if deck:
+            deck["course_ids"] = [course_id_to_show] + [i for i in deck["course_ids"] if i != course_id_to_show]
+            session["discover_deck"] = deck
+        # The undone course becomes unseen again
+        user = get_current_user()
+        if user:
+            user.mark_course_unseen(course_id_to_show)
         db.session.commit()
         flash("Last action undone!")
         # Redirect to discover showing the course that was just undone
@@ -1013,7 +1180,7 @@ def discover_undo():
 def matches():
     """Matches page with sorting game and saved classes"""
     user_id = session["user_id"]
-    user = User.query.get(user_id)
+    user = get_current_user()
     
     # Handle case where user doesn't exist (e.g., after database recreation)
     if not user:
@@ -1021,18 +1188,9 @@ def matches():
         flash("Your session has expired. Please log in again.", "error")
         return redirect("/login")
     
-    # Get user's liked/starred courses, filtered by term preference
-    saved_courses_query = UserCoursePreference.query.filter(
-        and_(
-            UserCoursePreference.user_id == user_id,
-            UserCoursePreference.status.in_(['heart', 'star'])
-        )
-    ).join(Course)
-    
-    # Filter by term preference if set
+    # Get user's liked/starred courses (with their courses in the same query), filtered by term preference
     user_terms = user.get_terms()
-    if user_terms:
-        saved_courses_query = saved_courses_query.filter(Course.term_description.in_(user_terms))
+    saved_courses_query = saved_preferences_query(user_id, user_terms)
     
     saved_courses = saved_courses_query.all()
     
@@ -1044,24 +1202,8 @@ def matches():
             courses_by_term[term] = []
         courses_by_term[term].append(pref)
     
-    # Get all comparisons and group by term
-    all_comparisons = SortComparison.query.filter_by(user_id=user_id).all()
-    
-    # Build a map of course_id -> term for quick lookup
-    course_term_map = {}
-    for pref in saved_courses:
-        course_term_map[pref.course.id] = pref.course.term_description or "Other"
-    
-    # Group comparisons by term (both courses must be in same term)
-    comparisons_by_term = {}
-    for comp in all_comparisons:
-        term1 = course_term_map.get(comp.winner_course_id)
-        term2 = course_term_map.get(comp.loser_course_id)
-        # Only include comparisons where both courses are in the same term
-        if term1 and term2 and term1 == term2:
-            if term1 not in comparisons_by_term:
-                comparisons_by_term[term1] = []
-            comparisons_by_term[term1].append(comp)
+    # Precomputed per-term rankings, kept up to date by /matches/compare and /matches/undo
+    term_rankings = load_term_rankings(user_id)
     
     # Calculate rankings separately for each term
     rankings_by_term = {}
@@ -1070,21 +1212,17 @@ def matches():
     min_comparisons_by_term = {}
     
     for term, prefs in courses_by_term.items():
-        # Get courses for this term
-        term_courses = [pref.course for pref in prefs]
-        
-        # Get comparisons for this term only
-        term_comparisons = comparisons_by_term.get(term, [])
-        comparison_count_by_term[term] = len(term_comparisons)
+        ranking = term_rankings.get(term)
+        comparison_count_by_term[term] = ranking.comparison_count if ranking else 0
         
         # Minimum comparisons needed for this term
-        total_courses_in_term = len(term_courses)
+        total_courses_in_term = len(prefs)
         min_comparisons_by_term[term] = max(3, min(10, total_courses_in_term - 1)) if total_courses_in_term > 1 else 0
         show_ranked_list_by_term[term] = comparison_count_by_term[term] >= min_comparisons_by_term[term]
         
-        # Calculate rankings for this term only
-        if term_comparisons:
-            rankings_by_term[term] = rank_courses_binary_search(term_courses, term_comparisons)
+        # Read this term's ranking (saved courses that were never compared are slotted in by the engine)
+        if ranking and ranking.comparison_count:
+            rankings_by_term[term] = ranking.rankings([pref.course.id for pref in prefs])
         else:
             rankings_by_term[term] = {}
     
@@ -1096,34 +1234,21 @@ def matches():
     available_terms = [term for term, prefs in courses_by_term.items() if len(prefs) >= 2]
     
     if available_terms:
-        # Build compared pairs set (by term)
-        compared_pairs_by_term = {}
-        for term in available_terms:
-            compared_pairs_by_term[term] = set()
-            term_comparisons = comparisons_by_term.get(term, [])
-            for comp in term_comparisons:
-                compared_pairs_by_term[term].add((comp.winner_course_id, comp.loser_course_id))
-                compared_pairs_by_term[term].add((comp.loser_course_id, comp.winner_course_id))
-        
-        # Try to find an available pair within a single term
-        available_pairs_by_term = {}
+        # Ask each term's ranking for its most informative next comparison
+        next_pairs_by_term = {}
         for term in available_terms:
-            term_prefs = courses_by_term[term]
-            term_compared = compared_pairs_by_term.get(term, set())
-            available_pairs = []
-            for i, pref1 in enumerate(term_prefs):
-                for pref2 in term_prefs[i+1:]:
-                    if (pref1.course.id, pref2.course.id) not in term_compared:
-                        available_pairs.append((pref1.course, pref2.course))
-            if available_pairs:
-                available_pairs_by_term[term] = available_pairs
+            ranking = term_rankings.get(term) or TermRanking(beats={})
+            pair = ranking.next_comparison([pref.course.id for pref in courses_by_term[term]])
+            if pair:
+                next_pairs_by_term[term] = pair
         
-        # Pick a random term with available pairs, or any term if all pairs are compared
-        if available_pairs_by_term:
-            comparison_term = random.choice(list(available_pairs_by_term.keys()))
-            comparison_pair = random.choice(available_pairs_by_term[comparison_term])
+        # Pick a random term that still has something to learn, or any term if all orders are settled
+        if next_pairs_by_term:
+            comparison_term = random.choice(list(next_pairs_by_term.keys()))
+            courses_by_id = {pref.course.id: pref.course for pref in courses_by_term[comparison_term]}
+            comparison_pair = tuple(courses_by_id[course_id] for course_id in next_pairs_by_term[comparison_term])
         else:
-            # All pairs compared in all terms, pick any random pair from same term
+            # Every term's order is fully determined, pick any random pair from same term
             comparison_term = random.choice(available_terms)
             term_prefs = courses_by_term[comparison_term]
             comparison_pair = tuple(random.sample([pref.course for pref in term_prefs], 2))
@@ -1131,17 +1256,17 @@ def matches():
     # Sort each term group based on whether rankings are shown for that term
     for term, prefs in courses_by_term.items():
         show_ranked = show_ranked_list_by_term.get(term, False)
-        term_rankings = rankings_by_term.get(term, {})
+        course_ranks = rankings_by_term.get(term, {})
         
-        if show_ranked and term_rankings:
+        if show_ranked and course_ranks:
             # Use rankings: sort by rank ascending (rank 0 = best = position 1 at top)
             # Rank 0 should appear first, then 1, then 2, etc.
             prefs.sort(key=lambda p: (
-                term_rankings.get(p.course.id, 999)  # Lower rank number = better course = appears higher in list
+                course_ranks.get(p.course.id, 999)  # Lower rank number = better course = appears higher in list
             ))
             # Create ranking positions (1-based)
             for pref in prefs:
-                rank_pos = term_rankings.get(pref.course.id, None)
+                rank_pos = course_ranks.get(pref.course.id, None)
                 if rank_pos is not None:
                     pref.ranking_position = rank_pos + 1  # Convert 0-based to 1-based
                 else:
@@ -1157,9 +1282,6 @@ def matches():
     total_comparison_count = sum(comparison_count_by_term.values())
     total_courses = sum(len(prefs) for prefs in courses_by_term.values())
     
-    # Determine if any term has enough comparisons (for general progress message)
-    any_ranked = any(show_ranked_list_by_term.values())
-    
     return render_template("matches.html",
                          comparison_pair=comparison_pair,
                          comparison_term=comparison_term,
@@ -1212,6 +1334,8 @@ def compare():
             loser_course_id=loser_id
         )
         db.session.add(comparison)
+        # Update the stored ranking in the same transaction
+        record_comparison(user_id, winner_course.term_description or "Other", winner_id, loser_id)
         db.session.commit()
     
     return redirect("/matches")
@@ -1229,6 +1353,8 @@ def undo_comparison():
     ).order_by(SortComparison.timestamp.desc()).first()
     
     if last_comparison:
+        term = last_comparison.winner_course.term_description or "Other"
+        forget_comparison(user_id, term, last_comparison.winner_course_id, last_comparison.loser_course_id)
         db.session.delete(last_comparison)
         db.session.commit()
         flash("Last comparison undone", "success")
@@ -1268,6 +1394,10 @@ def update_preference():
     
     if action == "remove":
         db.session.delete(preference)
+        # Removed courses can be discovered again
+        user = get_current_user()
+        if user:
+            user.mark_course_unseen(course_id)
     elif action in ['heart', 'star']:
         preference.status = action
     else:
@@ -1277,137 +1407,92 @@ def update_preference():
     return redirect("/matches")
 
 
+def publish_catalog():
+    """Write the catalog snapshot for the next catalog version, then bump the version so every worker reloads"""
+    count = write_catalog_snapshot(CATALOG_SNAPSHOT_PATH, catalog_version=get_catalog_version() + 1)
+    version = bump_catalog_version()
+    print(f"Published catalog version {version} ({count} courses in the snapshot)")
+
+
 @app.cli.command("import-courses")
-@click.argument("json_file")
-def import_courses(json_file):
-    """Import courses from JSON file"""
-    print(f"Loading courses from {json_file}...")
-    
-    with open(json_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    courses_data = data.get('courses', [])
-    print(f"Found {len(courses_data)} course entries")
-    
-    imported = 0
-    updated = 0
-    skipped = 0
-    
-    for course_data in courses_data:
-        course_id = course_data.get('courseID')
-        if not course_id:
-            skipped += 1
+@click.argument("paths", nargs=-1, required=True)
+@click.option("--batch-size", default=500, show_default=True, help="Courses written per upsert statement/commit")
+@click.option("--mark-removed", is_flag=True, help="Mark courses missing from the files (for the terms and schools they cover) as inactive")
+@click.option("--workers", type=int, default=None, help="Processes parsing files in parallel (default: number of CPUs)")
+def import_courses(paths, batch_size, mark_removed, workers):
+    """Import courses from JSON files or directories of *_courses.json files"""
+    json_files = catalog_files_for(paths)
+    if not json_files:
+        print("No catalog files found")
+        return
+    workers = workers or os.cpu_count() or 1
+    for json_file in json_files:
+        print(f"Loading courses from {json_file}...")
+    
+    writer = CourseWriter(batch_size)
+    failed = []
+    # Files are parsed and mapped in worker processes; this process is the only writer.
+    # Each file's "courses" array is streamed, so memory is bounded by the batches in flight.
+    for json_file, batch, skipped, error in map_catalog_files(json_files, batch_size, workers):
+        if batch is None:
+            if error:
+                print(f"Error importing {json_file}: {error}")
+                failed.append(json_file)
             continue
-        
-        # Extract term description early so we can use it for duplicate checking
-        term_description = course_data.get('termDescription', '')
-        
-        # Check if course already exists for this specific term (same course can exist in multiple semesters)
-        existing = Course.query.filter_by(
-            course_id=str(course_id),
-            term_description=term_description
-        ).first()
-        
-        # Extract instructor name
-        instructors = course_data.get('publishedInstructors', [])
-        instructor_name = ', '.join([inst.get('instructorName', '') for inst in instructors]) if instructors else None
-        
-        # Extract meeting info
-        meetings = course_data.get('meetings', [])
-        start_time = None
-        end_time = None
-        days_of_week = None
-        
-        if isinstance(meetings, list) and len(meetings) > 0:
-            meeting = meetings[0]
-            if isinstance(meeting, dict):
-                start_time = meeting.get('startTime')
-                end_time = meeting.get('endTime')
-                days_list = meeting.get('daysOfWeek', [])
-                if days_list:
-                    # Convert day names to abbreviations
-                    day_map = {
-                        'Monday': 'M',
-                        'Tuesday': 'T',
-                        'Wednesday': 'W',
-                        'Thursday': 'Th',
-                        'Friday': 'F',
-                        'Saturday': 'S',
-                        'Sunday': 'Su'
-                    }
-                    days_of_week = ','.join([day_map.get(day, day) for day in days_list])
-        
-        # Extract requirement flags
-        divisional_dist = course_data.get('divisionalDistribution')
-        quant_reasoning = course_data.get('quantitativeReasoning')
-        
-        # Map requirements
-        science_tech_soc = False
-        aesthetics = False
-        ethics = False
-        histories = False
-        arts_hum = False
-        social_sci = False
-        science_eng = False
-        quant_reason = bool(quant_reasoning)
-        concentration_req = False
-        language_req = False
-        
-        # Map divisional distribution
-        if divisional_dist:
-            if 'Arts and Humanities' in divisional_dist:
-                arts_hum = True
-            if 'Social Sciences' in divisional_dist:
-                social_sci = True
-            if 'Science' in divisional_dist and 'Engineering' in divisional_dist:
-                science_eng = True
-        
-        # Note: The JSON doesn't seem to have explicit Gen Ed requirement flags
-        # You may need to add logic to detect these from other fields
-        
-        course_dict = {
-            'course_id': str(course_id),
-            'course_number': course_data.get('courseNumber', ''),
-            'course_title': course_data.get('courseTitle', ''),
-            'instructor_name': instructor_name,
-            'term_description': course_data.get('termDescription', ''),
-            'department': course_data.get('catalogSubjectDescription', ''),
-            'start_time': start_time,
-            'end_time': end_time,
-            'days_of_week': days_of_week,
-            'course_url': course_data.get('courseURL', ''),
-            'description': course_data.get('courseDescription', ''),
-            'quotes_json': None,  # QReports data not in JSON, can be added separately
-            'class_level_attribute': course_data.get('classLevelAttribute'),
-            'class_level_attribute_description': course_data.get('classLevelAttributeDescription'),
-            'course_component': course_data.get('courseComponent'),
-            'subject_description': course_data.get('subjectDescription'),
-            'catalog_school_description': course_data.get('catalogSchoolDescription'),
-            'science_and_technology_in_society': science_tech_soc,
-            'aesthetics_and_culture': aesthetics,
-            'ethics_and_civics': ethics,
-            'histories_societies_individuals': histories,
-            'arts_and_humanities': arts_hum,
-            'social_sciences': social_sci,
-            'science_engineering_applied': science_eng,
-            'quantitative_reasoning': quant_reason,
-            'concentration_requirement': concentration_req,
-            'language_requirement': language_req
-        }
-        
-        if existing:
-            # Update existing course
-            for key, value in course_dict.items():
-                setattr(existing, key, value)
-            updated += 1
-        else:
-            # Create new course
-            course = Course(**course_dict)
-            db.session.add(course)
-            imported += 1
+        writer.stats.skipped += skipped
+        for course_dict in batch:
+            writer.add(course_dict)
     
-    db.session.commit()
-    print(f"Import complete: {imported} imported, {updated} updated, {skipped} skipped")
+    # A file that failed part-way would make its unread courses look removed
+    removed_ids = writer.finish(mark_removed=mark_removed and not failed)
+    stats = writer.stats
+
+    # Rebuild the eligibility index here and in every running worker (only if something changed)
+    if stats.written or (mark_removed and not failed and removed_ids) or not os.path.exists(CATALOG_SNAPSHOT_PATH):
+        publish_catalog()
+
+    print(f"Found {stats.total} course entries in {len(json_files) - len(failed)} file(s)")
+    print(f"Import complete: {stats.added} added, {stats.changed} changed, {stats.unchanged} unchanged, "
+          f"{stats.removed} removed, {stats.skipped} skipped")
+    if failed and mark_removed:
+        print("Removed courses were left active because some files failed to import")
+    elif removed_ids and not mark_removed:
+        print("Removed courses were left active (use --mark-removed to hide them from recommendations)")
+    print(f"Wrote {stats.written} courses at {stats.rows_per_second():.0f} rows/sec")
+
+
+
+@app.cli.command("publish-catalog")
+def publish_catalog_command():
+    """Rewrite the catalog snapshot and bump the catalog version (e.g., after editing the Gen Ed files)"""
+    publish_catalog()
+
+
+@app.cli.command("migrate-preferences")
+def migrate_preferences():
+    """Move user preferences from the legacy JSON columns into the user_* tables"""
+    count = migrate_json_preferences()
+    print(f"Migrated preferences for {count} users")
+
+
+@app.cli.command("rebuild-rankings")
+def rebuild_rankings_command():
+    """Recompute every user's stored sorting game rankings from their comparisons"""
+    count = rebuild_rankings()
+    print(f"Rebuilt {count} rankings")
+
+
+@app.cli.command("backfill-course-levels")
+@click.option("--all", "refresh_all", is_flag=True, help="Recompute every course, not just unclassified ones")
+def backfill_course_levels(refresh_all):
+    """Compute stored course number, level and FYSEMR/tutorial/language flag columns for existing courses"""
+    updated = backfill_course_classification(refresh_all=refresh_all)
+    publish_catalog()
+    print(f"Backfill complete: {updated} courses classified")
+
+
+# The same backfill under the name that describes the FYSEMR/tutorial/language flags
+app.cli.add_command(backfill_course_levels, "backfill-course-flags")
 
 
 if __name__ == "__main__":
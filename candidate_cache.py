@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+
+
+class CandidateCache:
+    """
+    Process-wide LRU cache of weighted candidate pools, keyed by profile fingerprint.
+
+    Users with the same affiliation, year, terms, concentrations, requirements and
+    schools get the same candidates before their swiped courses are removed, so
+    the pool is computed once per profile and each user's seen set is subtracted
+    from the cached copy. Entries are tagged with the catalog version and the
+    whole cache is dropped when a newer version is seen.
+    """
+
+    def __init__(self, max_entries=256, max_course_ids=2_000_000):
+        self.max_entries = max_entries
+        # Bound on the course ids held across all entries (one pool can cover a whole term)
+        self.max_course_ids = max_course_ids
+        # fingerprint -> WeightedSampler over course ids, least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, fingerprint, version):
+        """Return the cached candidate sampler for a profile, or None"""
+        with self._lock:
+            if not self._advance(version):
+                # A request still running against an older catalog version
+                self.misses += 1
+                return None
+            pool = self._entries.get(fingerprint)
+            if pool is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return pool
+
+    def put(self, fingerprint, version, pool):
+        """Store a profile's candidate sampler, evicting the least recently used pools over the limits"""
+        with self._lock:
+            # Pools from an older version, or larger than the whole budget, are served uncached
+            if not self._advance(version) or len(pool) > self.max_course_ids or self.max_entries <= 0:
+                return pool
+            previous = self._entries.pop(fingerprint, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[fingerprint] = pool
+            self._size += len(pool)
+            while len(self._entries) > self.max_entries or self._size > self.max_course_ids:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+            return pool
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _advance(self, version):
+        """Drop every pool when version is newer than the cached one; False if version is older"""
+        if self._version is None or version > self._version:
+            # The catalog was re-imported since these pools were computed
+            self._clear()
+            self._version = version
+        return version == self._version
+
+    def _clear(self):
+        self._entries.clear()
+        self._size = 0
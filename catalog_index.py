@@ -0,0 +1,298 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+from models import db, Course, classify_course_flags, classify_course_level, parse_course_number
+from sampler import weight_code
+
+
+# Requirement flag columns indexed by the eligibility index
+REQUIREMENT_FLAG_COLUMNS = [
+    "science_and_technology_in_society",
+    "aesthetics_and_culture",
+    "ethics_and_civics",
+    "histories_societies_individuals",
+    "arts_and_humanities",
+    "social_sciences",
+    "science_engineering_applied",
+    "quantitative_reasoning",
+    "concentration_requirement",
+    "language_requirement",
+]
+
+
+class CourseRecord(namedtuple("CourseRecord", [
+    "id", "course_number", "course_title", "term_description", "department",
+    "catalog_school_description", "language_requirement", "course_num", "level", "weight_code",
+    "is_fysemr", "is_tutorial", "is_language_course", "language_intro_level",
+])):
+    """Lightweight, read-only view of a course used by the recommendation pipeline.
+
+    Exposes the same helper methods as Course so the grade-level rules and
+    weighting can run on either ORM objects or index records. weight_code is
+    the level (or FYSEMR) feature code the per-year weight vectors are indexed by.
+    """
+    __slots__ = ()
+
+    def extract_course_number(self):
+        """Return the pre-computed numeric course number"""
+        return self.course_num
+
+    def classify_level(self):
+        """Return the pre-computed level class"""
+        return self.level
+
+
+# Columns selected to build a CourseRecord (its fields, then what classifying an unclassified row needs)
+RECORD_COLUMNS = (
+    Course.id,
+    Course.course_number,
+    Course.course_title,
+    Course.term_description,
+    Course.department,
+    Course.catalog_school_description,
+    Course.language_requirement,
+    Course.course_num,
+    Course.level,
+    Course.is_fysemr,
+    Course.is_tutorial,
+    Course.is_language_course,
+    Course.language_intro_level,
+    Course.class_level_attribute,
+    Course.course_component,
+)
+
+
+def course_record(row):
+    """
+    Build a CourseRecord from a row selected with RECORD_COLUMNS.
+
+    Rows are plain tuples, so candidates never enter the session identity map
+    and never carry descriptions, URLs or QReports quotes.
+    """
+    language_requirement = bool(row.language_requirement)
+    course_num = row.course_num
+    level = row.level
+    flags = {
+        'is_fysemr': row.is_fysemr,
+        'is_tutorial': row.is_tutorial,
+        'is_language_course': row.is_language_course,
+        'language_intro_level': row.language_intro_level,
+    }
+    if level is None or row.is_fysemr is None:
+        # Not classified yet (see backfill-course-levels)
+        course_num = parse_course_number(row.course_number)
+        level = classify_course_level(row.course_number, row.class_level_attribute)
+        flags = classify_course_flags(row.course_number, row.course_title, row.course_component, language_requirement)
+    return CourseRecord(
+        id=row.id,
+        course_number=row.course_number,
+        course_title=row.course_title,
+        term_description=row.term_description,
+        department=row.department,
+        catalog_school_description=row.catalog_school_description,
+        language_requirement=language_requirement,
+        course_num=course_num,
+        level=level,
+        weight_code=weight_code(level, flags['is_fysemr']),
+        **flags,
+    )
+
+
+class CatalogIndex:
+    """
+    Process-wide inverted index over the courses table.
+
+    Each posting maps a key (term, department, requirement flag, level class,
+    catalog school, course number) to the frozenset of course ids having that
+    value, so the recommendation filters become set operations in memory.
+    """
+
+    def __init__(self, records=(), version=None, postings=()):
+        self.version = version
+        self.records = {}
+        self.by_term = {}
+        self.by_department = {}
+        self.by_flag = {column: set() for column in REQUIREMENT_FLAG_COLUMNS}
+        self.by_level = {}
+        self.by_school = {}
+        self.by_course_number = {}
+        self.by_course_num = {}
+        self.fysemr_ids = set()
+
+        for record, flags in records:
+            self.records[record.id] = record
+            self._add(record.id, record.term_description, record.department, record.catalog_school_description,
+                      record.level, record.course_number, record.course_num, record.is_fysemr, flags)
+        # Posting tuples without records (see from_snapshot)
+        for posting in postings:
+            self._add(*posting)
+        self._freeze()
+
+    def _add(self, course_id, term, department, school, level, course_number, course_num, is_fysemr, flags):
+        """Add one course to the postings"""
+        self.by_term.setdefault(term, set()).add(course_id)
+        self.by_department.setdefault(department, set()).add(course_id)
+        self.by_level.setdefault(level, set()).add(course_id)
+        self.by_school.setdefault(school, set()).add(course_id)
+        self.by_course_number.setdefault(course_number, set()).add(course_id)
+        self.by_course_num.setdefault(course_num, set()).add(course_id)
+        for column, value in zip(REQUIREMENT_FLAG_COLUMNS, flags):
+            if value:
+                self.by_flag[column].add(course_id)
+        if is_fysemr:
+            self.fysemr_ids.add(course_id)
+
+    def _freeze(self):
+        """Freeze postings so they can be shared safely between request threads"""
+        for postings in (self.by_term, self.by_department, self.by_flag, self.by_level,
+                         self.by_school, self.by_course_number, self.by_course_num):
+            for key in postings:
+                postings[key] = frozenset(postings[key])
+        self.fysemr_ids = frozenset(self.fysemr_ids)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, version=None):
+        """
+        Build the index from a CatalogSnapshot instead of scanning the courses table.
+
+        Records are not copied: index.records is the snapshot itself, which decodes
+        a CourseRecord from the shared mapping when the pipeline asks for one.
+        """
+        index = cls(version=version, postings=snapshot.postings())
+        index.records = snapshot
+        return index
+
+    @classmethod
+    def build(cls, version=None):
+        """Build the index from the active courses, loading only the filterable columns"""
+        flag_columns = [getattr(Course, column) for column in REQUIREMENT_FLAG_COLUMNS]
+        rows = db.session.query(*RECORD_COLUMNS, *flag_columns).filter(Course.is_active).order_by(Course.id).all()
+
+        records = []
+        for row in rows:
+            records.append((course_record(row), tuple(row[len(RECORD_COLUMNS):])))
+        return cls(records, version=version)
+
+    @staticmethod
+    def _union(postings, keys):
+        """Union the postings for each key (missing keys contribute nothing)"""
+        result = set()
+        for key in keys:
+            result |= postings.get(key, frozenset())
+        return result
+
+    def ids_for_terms(self, terms):
+        return self._union(self.by_term, terms)
+
+    def ids_for_departments(self, departments):
+        return self._union(self.by_department, departments)
+
+    def ids_for_course_numbers(self, course_numbers):
+        return self._union(self.by_course_number, course_numbers)
+
+    def ids_for_flag(self, column):
+        return self.by_flag.get(column, frozenset())
+
+    def ids_for_schools(self, schools):
+        return self._union(self.by_school, schools)
+
+    def ids_for_school_containing(self, fragment):
+        """Ids whose catalog school contains fragment (mirrors LIKE '%fragment%')"""
+        fragment = fragment.lower()
+        return self._union(self.by_school, [
+            school for school in self.by_school
+            if school and fragment in school.lower()
+        ])
+
+    def ids_for_levels(self, levels):
+        return self._union(self.by_level, levels)
+
+    def ids_for_course_num_ranges(self, ranges):
+        """Ids whose numeric course number falls in any of the inclusive (low, high) ranges"""
+        return self._union(self.by_course_num, [
+            num for num in self.by_course_num
+            if num is not None and any(low <= num <= high for low, high in ranges)
+        ])
+
+    def records_for(self, course_ids):
+        """Return CourseRecords for the given ids in ascending id order"""
+        return [self.records[course_id] for course_id in sorted(course_ids)]
+
+
+_catalog_index = None
+_catalog_index_lock = threading.Lock()
+
+
+class VersionPoller:
+    """
+    Process-wide view of the catalog version, re-read from the database at most every interval seconds.
+
+    on_change is called with the new version whenever a re-read finds it moved.
+    """
+
+    def __init__(self, read, interval=5.0, on_change=None):
+        self.read = read
+        self.interval = interval
+        self.on_change = on_change
+        self._version = None
+        self._checked_at = 0.0
+
+    def current(self):
+        now = time.monotonic()
+        if self._version is None or now - self._checked_at >= self.interval:
+            version = self.read()
+            self._checked_at = now
+            if self._version is not None and version != self._version and self.on_change:
+                self.on_change(version)
+            self._version = version
+        return self._version
+
+
+def load_catalog_index(version=None, snapshot_path=None):
+    """Build the index from the catalog snapshot if one was written for this version, otherwise from the courses table"""
+    if snapshot_path and os.path.exists(snapshot_path):
+        # Imported here: catalog_snapshot builds on this module's CourseRecord
+        from catalog_snapshot import CatalogSnapshot
+        try:
+            snapshot = CatalogSnapshot(snapshot_path)
+            if snapshot.catalog_version == version:
+                return CatalogIndex.from_snapshot(snapshot, version=version)
+            print(f"Catalog snapshot is for version {snapshot.catalog_version}, not {version}; scanning the courses table")
+        except (OSError, ValueError) as e:
+            print(f"Error reading catalog snapshot, scanning the courses table instead: {e}")
+    return CatalogIndex.build(version=version)
+
+
+def get_catalog_index(version, snapshot_path=None):
+    """
+    Return the process-wide catalog index for the given catalog version (or a newer one).
+
+    The new index is built off to the side and swapped in with one assignment.
+    Requests that already hold the previous index keep using it, and it is freed
+    once the last of them finishes. While one thread rebuilds, the others keep
+    serving the previous version instead of waiting.
+
+    Args:
+        version: Catalog version the caller has seen (see models.get_catalog_version)
+        snapshot_path: Catalog snapshot written by import-courses (see catalog_snapshot.py)
+
+    Returns:
+        CatalogIndex instance
+    """
+    global _catalog_index
+    index = _catalog_index
+    # Versions only grow, so an index at least as new as the caller's version is current enough
+    if index is not None and index.version >= version:
+        return index
+
+    if not _catalog_index_lock.acquire(blocking=index is None):
+        return index
+    try:
+        # Another thread may have rebuilt it while we waited for the lock
+        if _catalog_index is None or _catalog_index.version < version:
+            _catalog_index = load_catalog_index(version, snapshot_path)
+        return _catalog_index
+    finally:
+        _catalog_index_lock.release()
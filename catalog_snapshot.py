@@ -0,0 +1,224 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from models import db, Course
+from catalog_index import REQUIREMENT_FLAG_COLUMNS, RECORD_COLUMNS, CourseRecord, course_record
+
+
+# File layout: MAGIC, header length (uint32), JSON header, then 8-byte aligned fixed-width arrays
+MAGIC = b"CCSNAP01"
+FORMAT_VERSION = 1
+
+# Bits of the "flags" array: the requirement flags, then the import-time classification flags
+FLAG_BITS = REQUIREMENT_FLAG_COLUMNS + ["is_fysemr", "is_tutorial", "is_language_course"]
+
+# Sentinels for NULL in the integer columns
+NO_COURSE_NUM = -(2 ** 31)
+NO_INTRO_LEVEL = -1
+
+# Dictionary-coded string columns (code = position in the header's value table)
+CODED_COLUMNS = ["term_description", "department", "catalog_school_description", "level"]
+
+
+def _align(data):
+    data.extend(bytes(-len(data) % 8))
+
+
+def write_catalog_snapshot(path, catalog_version=None):
+    """
+    Write the active courses' filterable columns to a read-only binary snapshot.
+
+    The file is written next to path and renamed over it, so workers that still
+    map the previous snapshot keep a valid file until they let go of it.
+
+    Args:
+        path: Snapshot file (e.g., instance/catalog.snapshot)
+        catalog_version: Catalog version the snapshot was taken at, stored in the header
+
+    Returns:
+        Number of courses written
+    """
+    flag_columns = [getattr(Course, column) for column in REQUIREMENT_FLAG_COLUMNS]
+    rows = db.session.query(*RECORD_COLUMNS, *flag_columns).filter(Course.is_active).order_by(Course.id).all()
+
+    tables = {column: {} for column in CODED_COLUMNS}
+    columns = {
+        "ids": array("I"),
+        "course_nums": array("i"),
+        "intro_levels": array("b"),
+        "weight_codes": array("B"),
+        "flags": array("I"),
+        "number_offsets": array("I", [0]),
+        "title_offsets": array("I", [0]),
+    }
+    codes = {column: array("H") for column in CODED_COLUMNS}
+    numbers = bytearray()
+    titles = bytearray()
+
+    for row in rows:
+        record = course_record(row)
+        values = dict(zip(REQUIREMENT_FLAG_COLUMNS, row[len(RECORD_COLUMNS):]))
+        values.update(is_fysemr=record.is_fysemr, is_tutorial=record.is_tutorial,
+                      is_language_course=record.is_language_course)
+
+        columns["ids"].append(record.id)
+        columns["course_nums"].append(NO_COURSE_NUM if record.course_num is None else record.course_num)
+        columns["intro_levels"].append(
+            NO_INTRO_LEVEL if record.language_intro_level is None else record.language_intro_level
+        )
+        columns["weight_codes"].append(record.weight_code)
+        columns["flags"].append(sum(1 << bit for bit, name in enumerate(FLAG_BITS) if values[name]))
+        for column in CODED_COLUMNS:
+            table = tables[column]
+            codes[column].append(table.setdefault(getattr(record, column), len(table)))
+        numbers.extend((record.course_number or "").encode("utf-8"))
+        columns["number_offsets"].append(len(numbers))
+        titles.extend((record.course_title or "").encode("utf-8"))
+        columns["title_offsets"].append(len(titles))
+
+    body = bytearray()
+    layout = {}
+    for name, values in list(columns.items()) + [(f"{column}_codes", codes[column]) for column in CODED_COLUMNS]:
+        layout[name] = [len(body), values.typecode, len(values)]
+        body.extend(values.tobytes())
+        _align(body)
+    for name, blob in (("numbers", numbers), ("titles", titles)):
+        layout[name] = [len(body), "B", len(blob)]
+        body.extend(blob)
+        _align(body)
+
+    header = json.dumps({
+        "format": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "catalog_version": catalog_version,
+        "count": len(rows),
+        "flag_bits": FLAG_BITS,
+        "tables": {column: list(tables[column]) for column in CODED_COLUMNS},
+        "arrays": layout,
+    }).encode("utf-8")
+    prefix = bytearray(MAGIC + struct.pack("<I", len(header)) + header)
+    _align(prefix)
+    # Array offsets in the header are relative to the end of the (aligned) header
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(prefix)
+        f.write(body)
+    os.replace(temporary_path, path)
+    return len(rows)
+
+
+class CatalogSnapshot:
+    """
+    Read-only, memory-mapped view of a snapshot written by write_catalog_snapshot().
+
+    The fixed-width arrays are memoryviews over the mapping, so every worker on
+    the host shares the same page-cache pages. Behaves as a read-only mapping of
+    course id -> CourseRecord; records are decoded on lookup.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        (header_length,) = struct.unpack_from("<I", self._mmap, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(view[start:start + header_length]))
+        if header["format"] != FORMAT_VERSION or header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written by an incompatible version")
+        if header["flag_bits"] != FLAG_BITS:
+            raise ValueError(f"{path} has different flag columns")
+        base = start + header_length
+        base += -base % 8
+
+        self.catalog_version = header["catalog_version"]
+        self.count = header["count"]
+        self.tables = header["tables"]
+        arrays = {}
+        for name, (offset, typecode, length) in header["arrays"].items():
+            size = array(typecode).itemsize
+            arrays[name] = view[base + offset:base + offset + length * size].cast(typecode)
+        self.ids = arrays["ids"]
+        self.course_nums = arrays["course_nums"]
+        self.intro_levels = arrays["intro_levels"]
+        self.weight_codes = arrays["weight_codes"]
+        self.flags = arrays["flags"]
+        self.codes = {column: arrays[f"{column}_codes"] for column in CODED_COLUMNS}
+        self._number_offsets = arrays["number_offsets"]
+        self._title_offsets = arrays["title_offsets"]
+        self._numbers = arrays["numbers"]
+        self._titles = arrays["titles"]
+
+    def __len__(self):
+        return self.count
+
+    def _string(self, blob, offsets, position):
+        return bytes(blob[offsets[position]:offsets[position + 1]]).decode("utf-8")
+
+    def course_number(self, position):
+        return self._string(self._numbers, self._number_offsets, position)
+
+    def record(self, position):
+        """Decode the CourseRecord stored at a row position"""
+        flags = self.flags[position]
+        course_num = self.course_nums[position]
+        intro_level = self.intro_levels[position]
+        coded = {column: self.tables[column][self.codes[column][position]] for column in CODED_COLUMNS}
+        return CourseRecord(
+            id=self.ids[position],
+            course_number=self.course_number(position),
+            course_title=self._string(self._titles, self._title_offsets, position),
+            language_requirement=bool(flags >> FLAG_BITS.index("language_requirement") & 1),
+            course_num=None if course_num == NO_COURSE_NUM else course_num,
+            weight_code=self.weight_codes[position],
+            is_fysemr=bool(flags >> FLAG_BITS.index("is_fysemr") & 1),
+            is_tutorial=bool(flags >> FLAG_BITS.index("is_tutorial") & 1),
+            is_language_course=bool(flags >> FLAG_BITS.index("is_language_course") & 1),
+            language_intro_level=None if intro_level == NO_INTRO_LEVEL else intro_level,
+            **coded,
+        )
+
+    def __getitem__(self, course_id):
+        # Rows are stored in ascending id order
+        position = bisect_left(self.ids, course_id)
+        if position == self.count or self.ids[position] != course_id:
+            raise KeyError(course_id)
+        return self.record(position)
+
+    def __contains__(self, course_id):
+        position = bisect_left(self.ids, course_id)
+        return position < self.count and self.ids[position] == course_id
+
+    def postings(self):
+        """
+        Yield (course id, posting keys, requirement flags) per course without decoding titles.
+
+        Used by CatalogIndex.from_snapshot() to build its postings.
+        """
+        tables = self.tables
+        term_codes, department_codes, school_codes, level_codes = (
+            self.codes[column] for column in CODED_COLUMNS
+        )
+        requirement_bits = range(len(REQUIREMENT_FLAG_COLUMNS))
+        fysemr_bit = FLAG_BITS.index("is_fysemr")
+        for position in range(self.count):
+            course_num = self.course_nums[position]
+            flags = self.flags[position]
+            yield (
+                self.ids[position],
+                tables["term_description"][term_codes[position]],
+                tables["department"][department_codes[position]],
+                tables["catalog_school_description"][school_codes[position]],
+                tables["level"][level_codes[position]],
+                self.course_number(position),
+                None if course_num == NO_COURSE_NUM else course_num,
+                bool(flags >> fysemr_bit & 1),
+                tuple(bool(flags >> bit & 1) for bit in requirement_bits),
+            )
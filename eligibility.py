@@ -0,0 +1,138 @@
+from collections import namedtuple
+
+from sqlalchemy import and_, func, or_, true
+
+from models import Course
+
+
+class EligibilityContext(namedtuple("EligibilityContext", [
+    "year", "excluded_levels", "exclude_tutorials", "language_requirement", "gened_course_codes",
+])):
+    """The parts of a Harvard College user's profile the eligibility rules depend on.
+
+    Args:
+        year: Class year (e.g., "Freshman")
+        excluded_levels: Level classes this year cannot take
+        exclude_tutorials: Whether tutorial courses are filtered out entirely
+        language_requirement: Whether only introductory language courses are shown
+        gened_course_codes: Gen Ed course numbers exempt from the grade-level rules (may be empty)
+    """
+    __slots__ = ()
+
+
+class EligibilityRule(namedtuple("EligibilityRule", ["name", "applies", "exempt", "sql", "keep"])):
+    """One row of the eligibility rule table.
+
+    applies(context) says whether the rule is active for a profile, sql(context)
+    builds the SQL clause a course must satisfy (None if SQL can't express it) and
+    keep(course, context) is the same test in memory on a Course or CourseRecord.
+    Courses matching one of the exempt names (see EXEMPTIONS) pass the rule anyway.
+    """
+    __slots__ = ()
+
+
+# Exemption name -> (SQL clause builder, in-memory test); a builder may return None when nothing is exempt
+EXEMPTIONS = {
+    # FYSEMR courses pass through to weighting (weight 0 for non-freshmen)
+    "fysemr": (
+        lambda context: Course.is_fysemr == True,
+        lambda course, context: bool(course.is_fysemr),
+    ),
+    # Gen Ed courses are open to all grades
+    "gened": (
+        lambda context: Course.course_number.in_(context.gened_course_codes) if context.gened_course_codes else None,
+        lambda course, context: course.course_number in context.gened_course_codes,
+    ),
+}
+
+
+ELIGIBILITY_RULES = [
+    # Level classes the year can never take (tutorials for other years, Grad_research, ...)
+    EligibilityRule(
+        name="excluded_levels",
+        applies=lambda context: True,
+        exempt=("fysemr", "gened"),
+        sql=lambda context: Course.level.notin_(context.excluded_levels),
+        keep=lambda course, context: course.classify_level() not in context.excluded_levels,
+    ),
+    # Freshmen don't see any course with "Tutorial" in the title
+    # (instr is case-sensitive, unlike LIKE in SQLite)
+    EligibilityRule(
+        name="freshman_title_tutorial",
+        applies=lambda context: context.year == "Freshman",
+        exempt=("fysemr", "gened"),
+        sql=lambda context: or_(Course.course_title.is_(None), func.instr(Course.course_title, "Tutorial") == 0),
+        keep=lambda course, context: not course.course_title or "Tutorial" not in course.course_title,
+    ),
+    # Divisional distribution requirements and freshmen without Gen Ed codes exclude tutorials outright
+    EligibilityRule(
+        name="tutorials",
+        applies=lambda context: context.exclude_tutorials,
+        exempt=(),
+        sql=lambda context: Course.is_tutorial == False,
+        keep=lambda course, context: not course.is_tutorial,
+    ),
+    # For the language requirement, only introductory language courses (1, 2, 3, A, B, AA, BA) are shown
+    # (language_intro_level is only set on language courses, see classify_course_flags)
+    EligibilityRule(
+        name="language_intro",
+        applies=lambda context: context.language_requirement,
+        exempt=("fysemr",),
+        sql=lambda context: Course.language_intro_level.isnot(None),
+        keep=lambda course, context: course.language_intro_level is not None,
+    ),
+]
+
+
+def active_rules(context):
+    return [rule for rule in ELIGIBILITY_RULES if rule.applies(context)]
+
+
+def eligibility_clause(context):
+    """
+    Compile the active rules into a single SQL WHERE clause.
+
+    Rules without an SQL form are left out; apply eligibility_predicate(context, sql_compiled=True) to the rows.
+
+    Returns:
+        SQLAlchemy boolean clause
+    """
+    clauses = []
+    for rule in active_rules(context):
+        clause = rule.sql(context)
+        if clause is None:
+            continue
+        exemptions = [EXEMPTIONS[name][0](context) for name in rule.exempt]
+        exemptions = [exemption for exemption in exemptions if exemption is not None]
+        clauses.append(or_(clause, *exemptions) if exemptions else clause)
+    return and_(true(), *clauses)
+
+
+def eligibility_predicate(context, sql_compiled=False):
+    """
+    Compile the active rules into an in-memory test on Course objects or CourseRecords.
+
+    Args:
+        context: EligibilityContext for the user
+        sql_compiled: Only include the rules eligibility_clause() couldn't express
+
+    Returns:
+        Function course -> bool, or None if no rule needs checking
+    """
+    rules = [
+        rule for rule in active_rules(context)
+        if not sql_compiled or rule.sql(context) is None
+    ]
+    if not rules:
+        return None
+    checks = [
+        (rule.keep, [EXEMPTIONS[name][1] for name in rule.exempt])
+        for rule in rules
+    ]
+
+    def keep(course):
+        for passes, exemptions in checks:
+            if not passes(course, context) and not any(exempt(course, context) for exempt in exemptions):
+                return False
+        return True
+    return keep
@@ -0,0 +1,122 @@
+import json
+import os
+import re
+import threading
+
+
+# Gen Ed files are named like "2025_Fall_Geneds.json" (term "2025 Fall")
+GENEDS_FILENAME_PATTERN = re.compile(r'^(\d{4})_([A-Za-z]+)_Geneds\.json$')
+
+
+def parse_geneds_file(path):
+    """
+    Parse a GenEds JSON file into a category -> set of genEdCode index.
+
+    Args:
+        path: Path to a GenEds JSON file
+
+    Returns:
+        Dictionary mapping category name to a frozenset of course codes
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    # Remove single-line and multi-line comments (/* ... */)
+    content = re.sub(r'/\*.*?\*/', '', content, flags=re.DOTALL)
+    # Remove the "categories" section with placeholders if it exists (not needed for our use case)
+    # We only need the "courses" array
+    content = re.sub(r',\s*"categories"\s*:\s*\{[^}]*\}', '', content, flags=re.DOTALL)
+    geneds_data = json.loads(content)
+
+    codes_by_category = {}
+    for course in geneds_data.get('courses', []):
+        gened_code = course.get('genEdCode', '')
+        if not gened_code:
+            continue
+        for category in course.get('categories', []):
+            codes_by_category.setdefault(category, set()).add(gened_code)
+    return {category: frozenset(codes) for category, codes in codes_by_category.items()}
+
+
+class GenEdCatalog:
+    """
+    In-memory GenEd catalog built from the *_Geneds.json files in a directory.
+
+    Each term file is parsed once and re-parsed only when its mtime changes.
+    New term files are discovered automatically.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        # term -> (mtime, {category: frozenset of codes})
+        self._terms = {}
+        self._lock = threading.Lock()
+
+    def _discover(self):
+        """Return {term: (path, mtime)} for every GenEds file in the directory"""
+        found = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError as e:
+            print(f"Error listing GenEds directory: {e}")
+            return found
+        for entry in entries:
+            match = GENEDS_FILENAME_PATTERN.match(entry.name)
+            if not match:
+                continue
+            term = f"{match.group(1)} {match.group(2)}"
+            try:
+                found[term] = (entry.path, entry.stat().st_mtime_ns)
+            except OSError:
+                continue
+        return found
+
+    def _refresh(self, terms):
+        """Load any requested term whose file is new or has changed"""
+        available = self._discover()
+        for term in terms:
+            if term not in available:
+                continue
+            path, mtime = available[term]
+            cached = self._terms.get(term)
+            if cached is not None and cached[0] == mtime:
+                continue
+            with self._lock:
+                cached = self._terms.get(term)
+                if cached is not None and cached[0] == mtime:
+                    continue
+                try:
+                    self._terms[term] = (mtime, parse_geneds_file(path))
+                except (OSError, ValueError) as e:
+                    # If file can't be loaded, skip it (callers fall back to flag-based filtering)
+                    print(f"Error loading GenEds JSON {path}: {e}")
+
+    def reload(self):
+        """Drop every parsed file so the next lookup re-reads them (called when the catalog version moves)"""
+        with self._lock:
+            self._terms = {}
+
+    def terms(self):
+        """Terms that currently have a GenEds file"""
+        return sorted(self._discover())
+
+    def codes_for(self, categories, terms):
+        """
+        Return the set of Gen Ed course codes in any of the categories for any of the terms.
+
+        Args:
+            categories: Category names (e.g., ["Aesthetics & Culture"])
+            terms: Term names (e.g., ["2025 Fall", "2026 Spring"])
+
+        Returns:
+            Set of course codes (e.g., {"GENED 1145", "GENED 1114"})
+        """
+        self._refresh(terms)
+        codes = set()
+        for term in terms:
+            cached = self._terms.get(term)
+            if cached is None:
+                continue
+            codes_by_category = cached[1]
+            for category in categories:
+                codes |= codes_by_category.get(category, frozenset())
+        return codes
@@ -0,0 +1,485 @@
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Course, SQLITE_MAX_VARIABLES, classify_course_flags, classify_course_level, parse_course_number
+
+
+# Day names in the catalog JSON -> abbreviations stored in days_of_week
+DAY_ABBREVIATIONS = {
+    'Monday': 'M',
+    'Tuesday': 'T',
+    'Wednesday': 'W',
+    'Thursday': 'Th',
+    'Friday': 'F',
+    'Saturday': 'S',
+    'Sunday': 'Su'
+}
+
+# Columns identifying a course row (same course can exist in multiple semesters)
+COURSE_KEY_COLUMNS = ('course_id', 'term_description')
+
+# Catalog exports picked up when import-courses is given a directory
+CATALOG_FILE_PATTERN = '*_courses.json'
+
+# Bytes read from the catalog file at a time while streaming
+READ_CHUNK_SIZE = 1 << 16
+
+_decoder = json.JSONDecoder()
+
+# Characters that can continue a number the decoder stopped short of
+_NUMBER_CHARS = frozenset('.eE+-0123456789')
+
+
+class _CatalogStream:
+    """Text buffer over a catalog file that reads more only when a value needs it"""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self):
+        """Drop consumed text and append the next chunk; returns False at end of file"""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it ('' at end of file)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read_more():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in catalog JSON at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value, reading further chunks until it is complete"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._read_more():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk ("5." + "5", "1e" + "3")
+            if (isinstance(value, (int, float)) and not isinstance(value, bool) and not self.eof
+                    and (end == len(self.buffer) or self.buffer[end] in _NUMBER_CHARS)
+                    and self._read_more()):
+                continue
+            self.pos = end
+            return value
+
+
+def iter_catalog_courses(json_file, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yield the entries of a catalog's top-level "courses" array one at a time.
+    
+    Only the current entry (plus one read chunk) is held in memory, so a
+    multi-school export never has to be loaded whole. Other top-level keys
+    are decoded and discarded.
+    
+    Args:
+        json_file: Path to a my.harvard catalog export
+        chunk_size: Characters read per file read
+    
+    Yields:
+        Course dictionaries in file order
+    """
+    with open(json_file, 'r', encoding='utf-8') as f:
+        stream = _CatalogStream(f, chunk_size)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            key = stream.value()
+            stream.expect(':')
+            if key == 'courses' and stream.peek() == '[':
+                stream.expect('[')
+                if stream.peek() == ']':
+                    stream.pos += 1
+                else:
+                    while True:
+                        yield stream.value()
+                        if stream.peek() == ',':
+                            stream.pos += 1
+                            continue
+                        stream.expect(']')
+                        break
+            else:
+                stream.value()
+            if stream.peek() == ',':
+                stream.pos += 1
+                continue
+            stream.expect('}')
+            return
+
+
+def map_course(course_data):
+    """
+    Map one my.harvard catalog entry to Course column values.
+    
+    Args:
+        course_data: Dictionary from the catalog's "courses" array
+    
+    Returns:
+        Dictionary of Course column values, or None if the entry has no courseID
+    """
+    course_id = course_data.get('courseID')
+    if not course_id:
+        return None
+    
+    # Extract instructor name
+    instructors = course_data.get('publishedInstructors', [])
+    instructor_name = ', '.join([inst.get('instructorName', '') for inst in instructors]) if instructors else None
+    
+    # Extract meeting info
+    meetings = course_data.get('meetings', [])
+    start_time = None
+    end_time = None
+    days_of_week = None
+    
+    if isinstance(meetings, list) and len(meetings) > 0:
+        meeting = meetings[0]
+        if isinstance(meeting, dict):
+            start_time = meeting.get('startTime')
+            end_time = meeting.get('endTime')
+            days_list = meeting.get('daysOfWeek', [])
+            if days_list:
+                # Convert day names to abbreviations
+                days_of_week = ','.join([DAY_ABBREVIATIONS.get(day, day) for day in days_list])
+    
+    # Extract requirement flags
+    divisional_dist = course_data.get('divisionalDistribution')
+    quant_reasoning = course_data.get('quantitativeReasoning')
+    
+    # Map requirements
+    science_tech_soc = False
+    aesthetics = False
+    ethics = False
+    histories = False
+    arts_hum = False
+    social_sci = False
+    science_eng = False
+    quant_reason = bool(quant_reasoning)
+    concentration_req = False
+    language_req = False
+    
+    # Map divisional distribution
+    if divisional_dist:
+        if 'Arts and Humanities' in divisional_dist:
+            arts_hum = True
+        if 'Social Sciences' in divisional_dist:
+            social_sci = True
+        if 'Science' in divisional_dist and 'Engineering' in divisional_dist:
+            science_eng = True
+    
+    # Note: The JSON doesn't seem to have explicit Gen Ed requirement flags
+    # You may need to add logic to detect these from other fields
+    
+    course_dict = {
+        'course_id': str(course_id),
+        'course_number': course_data.get('courseNumber', ''),
+        'course_title': course_data.get('courseTitle', ''),
+        'instructor_name': instructor_name,
+        'term_description': course_data.get('termDescription', ''),
+        'department': course_data.get('catalogSubjectDescription', ''),
+        'start_time': start_time,
+        'end_time': end_time,
+        'days_of_week': days_of_week,
+        'course_url': course_data.get('courseURL', ''),
+        'description': course_data.get('courseDescription', ''),
+        'quotes_json': None,  # QReports data not in JSON, can be added separately
+        'class_level_attribute': course_data.get('classLevelAttribute'),
+        'class_level_attribute_description': course_data.get('classLevelAttributeDescription'),
+        'course_component': course_data.get('courseComponent'),
+        'subject_description': course_data.get('subjectDescription'),
+        'catalog_school_description': course_data.get('catalogSchoolDescription'),
+        'science_and_technology_in_society': science_tech_soc,
+        'aesthetics_and_culture': aesthetics,
+        'ethics_and_civics': ethics,
+        'histories_societies_individuals': histories,
+        'arts_and_humanities': arts_hum,
+        'social_sciences': social_sci,
+        'science_engineering_applied': science_eng,
+        'quantitative_reasoning': quant_reason,
+        'concentration_requirement': concentration_req,
+        'language_requirement': language_req,
+        # Computed once here so recommendations can filter on indexed columns
+        'course_num': parse_course_number(course_data.get('courseNumber', '')),
+        'level': classify_course_level(course_data.get('courseNumber', ''), course_data.get('classLevelAttribute'))
+    }
+    course_dict.update(classify_course_flags(
+        course_dict['course_number'], course_dict['course_title'], course_dict['course_component'], language_req
+    ))
+    # Fingerprint the catalog fields so re-imports can skip unchanged courses
+    course_dict['content_hash'] = course_fingerprint(course_dict)
+    course_dict['is_active'] = True
+    return course_dict
+
+
+def course_fingerprint(course_dict):
+    """SHA-1 of the mapped course fields (key order independent)"""
+    payload = json.dumps(course_dict, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def catalog_files_for(paths, pattern=CATALOG_FILE_PATTERN):
+    """Expand files and directories (matching pattern inside them) into a sorted, de-duplicated file list"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, pattern))))
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+
+def map_catalog_file(json_file, batch_size):
+    """
+    Stream and map one catalog file.
+    
+    Yields:
+        (course_dicts, skipped) tuples with at most batch_size courses each
+    """
+    batch = []
+    skipped = 0
+    for course_data in iter_catalog_courses(json_file):
+        course_dict = map_course(course_data)
+        if course_dict is None:
+            skipped += 1
+            continue
+        batch.append(course_dict)
+        if len(batch) >= batch_size:
+            yield batch, skipped
+            batch = []
+            skipped = 0
+    if batch or skipped:
+        yield batch, skipped
+
+
+def _map_catalog_file_to_queue(json_file, batch_size, batches):
+    """Process pool worker: send mapped batches, then a (json_file, None, 0, error) end marker"""
+    try:
+        for batch, skipped in map_catalog_file(json_file, batch_size):
+            batches.put((json_file, batch, skipped, None))
+    except Exception as e:
+        batches.put((json_file, None, 0, str(e)))
+        return
+    batches.put((json_file, None, 0, None))
+
+
+def map_catalog_files(json_files, batch_size, workers=1):
+    """
+    Parse and map catalog files, in a process pool when workers > 1.
+    
+    Mapping is pure CPU work, so each file is handled by a worker process while
+    the caller stays the only database writer. Batches go through a bounded
+    queue, so at most a few batches per worker are in memory at once.
+    
+    Yields:
+        (json_file, course_dicts, skipped, error) in completion order. course_dicts
+        is None once a file is finished; error is set if the file could not be read.
+    """
+    if workers <= 1 or len(json_files) <= 1:
+        for json_file in json_files:
+            try:
+                for batch, skipped in map_catalog_file(json_file, batch_size):
+                    yield json_file, batch, skipped, None
+            except Exception as e:
+                # Same per-file report as the worker path (_map_catalog_file_to_queue)
+                yield json_file, None, 0, str(e)
+                continue
+            yield json_file, None, 0, None
+        return
+
+    with multiprocessing.Manager() as manager:
+        batches = manager.Queue(maxsize=workers * 2)
+        with ProcessPoolExecutor(max_workers=min(workers, len(json_files))) as pool:
+            futures = [pool.submit(_map_catalog_file_to_queue, json_file, batch_size, batches)
+                       for json_file in json_files]
+            remaining = len(json_files)
+            while remaining:
+                try:
+                    item = batches.get(timeout=1)
+                except queue.Empty:
+                    # A worker that died without sending its end marker would block us forever
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            raise future.exception()
+                    continue
+                if item[1] is None:
+                    remaining -= 1
+                yield item
+
+
+def existing_course_state():
+    """
+    Load what a re-import needs to know about the courses already stored.
+    
+    Returns:
+        Dictionary mapping (course_id, term_description) to
+        (id, content_hash, is_active, catalog_school_description)
+    """
+    rows = db.session.query(
+        Course.course_id, Course.term_description, Course.id, Course.content_hash, Course.is_active,
+        Course.catalog_school_description
+    )
+    return {(row[0], row[1]): (row[2], row[3], row[4], row[5]) for row in rows}
+
+
+def vanished_course_ids(existing, feed_keys, feed_scopes):
+    """
+    Ids of active courses missing from the feed, limited to the terms and schools the feed covers.
+    
+    Catalog exports are per school, so importing one school's file leaves other
+    schools' courses in the same term alone.
+    
+    Args:
+        existing: Result of existing_course_state() taken before the import
+        feed_keys: Set of (course_id, term_description) keys seen in the feed
+        feed_scopes: Set of (term_description, catalog_school_description) pairs seen in the feed
+    """
+    return [
+        course_pk for key, (course_pk, _, is_active, school) in existing.items()
+        if is_active and (key[1], school) in feed_scopes and key not in feed_keys
+    ]
+
+
+def deactivate_courses(course_ids):
+    """Mark courses inactive so recommendations skip them (saved preferences are kept). The caller commits."""
+    chunk_size = SQLITE_MAX_VARIABLES - 1
+    for start in range(0, len(course_ids), chunk_size):
+        db.session.execute(
+            update(Course)
+            .where(Course.id.in_(course_ids[start:start + chunk_size]))
+            .values(is_active=False)
+        )
+
+
+def upsert_courses(rows):
+    """
+    Write mapped courses with INSERT ... ON CONFLICT(course_id, term_description) DO UPDATE.
+    
+    Rows are split into as few statements as SQLite's bound parameter limit allows.
+    The caller commits.
+    """
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    rows_per_statement = max(1, SQLITE_MAX_VARIABLES // len(columns))
+    for start in range(0, len(rows), rows_per_statement):
+        stmt = sqlite_insert(Course.__table__).values(rows[start:start + rows_per_statement])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(COURSE_KEY_COLUMNS),
+            set_={column: stmt.excluded[column] for column in columns if column not in COURSE_KEY_COLUMNS}
+        )
+        db.session.execute(stmt)
+
+
+class ImportStats:
+    """Counters and timing for an import-courses run"""
+    
+    def __init__(self):
+        self.added = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.skipped = 0
+        self.started = time.perf_counter()
+    
+    @property
+    def written(self):
+        return self.added + self.changed
+    
+    @property
+    def total(self):
+        return self.added + self.changed + self.unchanged + self.skipped
+    
+    def rows_per_second(self):
+        elapsed = time.perf_counter() - self.started
+        return self.written / elapsed if elapsed > 0 else float(self.written)
+
+
+class CourseWriter:
+    """
+    Single writer for an import run: skips unchanged courses and upserts the rest in batches.
+    
+    Args:
+        batch_size: Courses written per upsert statement/commit
+    """
+    
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.stats = ImportStats()
+        # One query up front instead of a lookup per course
+        self.existing = existing_course_state()
+        self.feed_keys = set()
+        self.feed_scopes = set()
+        # Keyed by (course_id, term) so a course repeated in the feed is written once per batch
+        self.pending = {}
+    
+    def add(self, course_dict):
+        key = (course_dict['course_id'], course_dict['term_description'])
+        self.feed_keys.add(key)
+        self.feed_scopes.add((course_dict['term_description'], course_dict['catalog_school_description']))
+        stored = self.existing.get(key)
+        if stored is None:
+            self.stats.added += 1
+        elif stored[1] == course_dict['content_hash'] and stored[2]:
+            # Same content as the stored row - nothing to write
+            self.stats.unchanged += 1
+            return
+        else:
+            self.stats.changed += 1
+        # Later duplicates in the feed compare against this version
+        self.existing[key] = (stored[0] if stored else None, course_dict['content_hash'], True,
+                              course_dict['catalog_school_description'])
+        self.pending[key] = course_dict
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        upsert_courses(list(self.pending.values()))
+        db.session.commit()
+        self.pending = {}
+    
+    def finish(self, mark_removed=False):
+        """
+        Write the last batch and find courses missing from the feed.
+        
+        Returns:
+            List of ids of removed courses (deactivated if mark_removed)
+        """
+        upsert_courses(list(self.pending.values()))
+        self.pending = {}
+        removed_ids = vanished_course_ids(self.existing, self.feed_keys, self.feed_scopes)
+        self.stats.removed = len(removed_ids)
+        if mark_removed:
+            deactivate_courses(removed_ids)
+        db.session.commit()
+        return removed_ids
@@ -0,0 +1,48 @@
+from sqlalchemy.orm import contains_eager, load_only
+
+from models import db, Course, UserCoursePreference
+
+
+# Course columns rendered by the matches page (saved list and comparison cards)
+MATCHES_COURSE_COLUMNS = (
+    "course_number", "course_title", "instructor_name", "term_description", "department",
+    "start_time", "end_time", "days_of_week", "course_url",
+)
+
+# Course columns rendered by the discover card, plus what the deck checks before showing it
+DISCOVER_COURSE_COLUMNS = MATCHES_COURSE_COLUMNS + ("description", "is_active")
+
+
+def _columns(names):
+    return [getattr(Course, name) for name in names]
+
+
+def saved_preferences_query(user_id, terms=None):
+    """
+    Hearted/starred preferences with their courses loaded by the same SELECT.
+    
+    pref.course is filled from the JOIN (contains_eager) instead of one lazy
+    load per preference, so /matches issues the same number of statements no
+    matter how many courses are saved.
+    
+    Args:
+        user_id: Owner of the preferences
+        terms: Only include courses in these terms (all terms if empty)
+    """
+    query = (
+        UserCoursePreference.query
+        .join(UserCoursePreference.course)
+        .filter(
+            UserCoursePreference.user_id == user_id,
+            UserCoursePreference.status.in_(['heart', 'star'])
+        )
+        .options(contains_eager(UserCoursePreference.course).load_only(*_columns(MATCHES_COURSE_COLUMNS)))
+    )
+    if terms:
+        query = query.filter(Course.term_description.in_(terms))
+    return query
+
+
+def discover_course(course_id):
+    """Load the columns of one course needed to render a discover card"""
+    return db.session.get(Course, course_id, options=[load_only(*_columns(DISCOVER_COURSE_COLUMNS))])
@@ -1,9 +1,20 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, or_, select, text, update
 from datetime import datetime, timezone
+import hashlib
 import json
 
+from seen import SeenSet
+
 db = SQLAlchemy()
 
+# Bound parameters SQLite allows per statement (SQLITE_MAX_VARIABLE_NUMBER, 32766 since SQLite 3.32);
+# multi-row statements are chunked to stay under it
+SQLITE_MAX_VARIABLES = 32766
+
+# Largest value an SQLite INTEGER column holds (binding a larger Python int raises OverflowError)
+SQLITE_MAX_INTEGER = 2**63 - 1
+
 
 class User(db.Model):
     """User model with authentication and preferences"""
@@ -16,17 +27,27 @@ class User(db.Model):
     # Profile preferences
     affiliation = db.Column(db.String(50))  # "Harvard College" or "Other"
     year = db.Column(db.String(20))  # Freshman, Sophomore, Junior, Senior
-    term_preference = db.Column(db.Text)  # JSON array of terms, e.g., ["2025 Fall", "2026 Spring"]
-    concentration_preferences = db.Column(db.Text)  # JSON array
-    requirement_preferences = db.Column(db.Text)  # JSON array
-    school_preferences = db.Column(db.Text)  # JSON array for "Other" affiliation schools
+    
+    # Legacy JSON array columns, only read by migrate_json_preferences() (preferences live in the user_* tables)
+    term_preference = db.Column(db.Text)
+    concentration_preferences = db.Column(db.Text)
+    requirement_preferences = db.Column(db.Text)
+    school_preferences = db.Column(db.Text)
+    
+    # Bitmap of swiped course ids (see SeenSet), kept in sync with course_preferences
+    seen_bitmap = db.Column(db.LargeBinary)
     
     # Relationships
     course_preferences = db.relationship('UserCoursePreference', backref='user', lazy=True, cascade='all, delete-orphan')
     sort_comparisons = db.relationship('SortComparison', backref='user', lazy=True, cascade='all, delete-orphan')
+    ranking_states = db.relationship('RankingState', backref='user', lazy=True, cascade='all, delete-orphan')
+    term_rows = db.relationship('UserTerm', order_by='UserTerm.position', lazy=True, cascade='all, delete-orphan')
+    concentration_rows = db.relationship('UserConcentration', order_by='UserConcentration.position', lazy=True, cascade='all, delete-orphan')
+    requirement_rows = db.relationship('UserRequirement', order_by='UserRequirement.position', lazy=True, cascade='all, delete-orphan')
+    school_rows = db.relationship('UserSchool', order_by='UserSchool.position', lazy=True, cascade='all, delete-orphan')
     
     def _parse_json(self, value):
-        """Helper method to parse JSON array"""
+        """Helper method to parse a legacy JSON array column"""
         if not value:
             return []
         try:
@@ -40,20 +61,115 @@ class User(db.Model):
             return []
     
     def get_concentrations(self):
-        """Parse concentration preferences from JSON"""
-        return self._parse_json(self.concentration_preferences)
+        """Selected concentrations, in the order they were picked"""
+        return [row.concentration for row in self.concentration_rows]
     
     def get_requirements(self):
-        """Parse requirement preferences from JSON"""
-        return self._parse_json(self.requirement_preferences)
+        """Selected requirements, in the order they were picked"""
+        return [row.requirement for row in self.requirement_rows]
     
     def get_schools(self):
-        """Parse school preferences from JSON"""
-        return self._parse_json(self.school_preferences)
+        """Selected schools ("Other" affiliation), in the order they were picked"""
+        return [row.school for row in self.school_rows]
     
     def get_terms(self):
-        """Parse term preferences from JSON"""
-        return self._parse_json(self.term_preference)
+        """Selected terms, in the order they were picked"""
+        return [row.term for row in self.term_rows]
+    
+    def set_concentrations(self, concentrations):
+        self.concentration_rows = [UserConcentration(concentration=value, position=position)
+                                   for position, value in enumerate(dict.fromkeys(concentrations or []))]
+    
+    def set_requirements(self, requirements):
+        self.requirement_rows = [UserRequirement(requirement=value, position=position)
+                                 for position, value in enumerate(dict.fromkeys(requirements or []))]
+    
+    def set_schools(self, schools):
+        self.school_rows = [UserSchool(school=value, position=position)
+                            for position, value in enumerate(dict.fromkeys(schools or []))]
+    
+    def set_terms(self, terms):
+        self.term_rows = [UserTerm(term=value, position=position)
+                          for position, value in enumerate(dict.fromkeys(terms or []))]
+    
+    def profile_fingerprint(self):
+        """Stable hash of the preferences that drive course recommendations"""
+        profile = [
+            self.affiliation,
+            self.year,
+            sorted(self.get_terms()),
+            sorted(self.get_concentrations()),
+            sorted(self.get_requirements()),
+            sorted(self.get_schools()),
+        ]
+        return hashlib.sha1(json.dumps(profile).encode('utf-8')).hexdigest()
+    
+    def get_seen_courses(self):
+        """Return a SeenSet of the course ids this user has swiped"""
+        if self.seen_bitmap is None:
+            # Not materialized yet - build it from the preference rows (stored on the next swipe)
+            rows = db.session.query(UserCoursePreference.course_id).filter_by(user_id=self.id)
+            return SeenSet.from_ids(row.course_id for row in rows)
+        return SeenSet(self.seen_bitmap)
+    
+    def mark_course_seen(self, course_id):
+        """Add a course to the seen bitmap (call alongside creating its preference)"""
+        seen = self.get_seen_courses()
+        seen.add(course_id)
+        self.seen_bitmap = seen.to_bytes()
+    
+    def mark_courses_seen(self, course_ids):
+        """Add several courses to the seen bitmap at once (call alongside upserting their preferences)"""
+        seen = self.get_seen_courses()
+        for course_id in course_ids:
+            seen.add(course_id)
+        self.seen_bitmap = seen.to_bytes()
+    
+    def mark_course_unseen(self, course_id):
+        """Remove a course from the seen bitmap (call alongside deleting its preference)"""
+        seen = self.get_seen_courses()
+        seen.discard(course_id)
+        self.seen_bitmap = seen.to_bytes()
+    
+    def clear_seen_courses(self):
+        """Empty the seen bitmap (call alongside deleting all preferences)"""
+        self.seen_bitmap = SeenSet().to_bytes()
+
+
+class UserTerm(db.Model):
+    """A term the user wants recommendations from"""
+    __tablename__ = 'user_terms'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    term = db.Column(db.String(50), primary_key=True, index=True)  # e.g., "2025 Fall"
+    position = db.Column(db.Integer, nullable=False, default=0)  # Order picked on the profile form
+
+
+class UserConcentration(db.Model):
+    """A concentration selected by a Harvard College user"""
+    __tablename__ = 'user_concentrations'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    concentration = db.Column(db.String(200), primary_key=True, index=True)  # e.g., "Statistics"
+    position = db.Column(db.Integer, nullable=False, default=0)
+
+
+class UserRequirement(db.Model):
+    """A requirement (Gen Ed category, divisional distribution, ...) selected by a Harvard College user"""
+    __tablename__ = 'user_requirements'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    requirement = db.Column(db.String(200), primary_key=True, index=True)  # e.g., "Aesthetics & Culture"
+    position = db.Column(db.Integer, nullable=False, default=0)
+
+
+class UserSchool(db.Model):
+    """A school selected by an "Other" affiliation user"""
+    __tablename__ = 'user_schools'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    school = db.Column(db.String(200), primary_key=True, index=True)  # e.g., "Harvard Business School"
+    position = db.Column(db.Integer, nullable=False, default=0)
 
 
 class Course(db.Model):
@@ -91,6 +207,18 @@ class Course(db.Model):
     concentration_requirement = db.Column(db.Boolean, default=False)
     language_requirement = db.Column(db.Boolean, default=False)
     
+    # Classification computed at import time (see classify_course_level)
+    course_num = db.Column(db.Integer, index=True)  # Numeric part of course_number, e.g., 50 for "COMPSCI 50"
+    level = db.Column(db.String(30), index=True)  # Level class, e.g., "UG_intro", "SophomoreTutorial"
+    is_fysemr = db.Column(db.Boolean, index=True)  # course_number starts with "FYSEMR"
+    is_tutorial = db.Column(db.Boolean, index=True)  # Tutorial component or "Tutorial" in the title
+    is_language_course = db.Column(db.Boolean, index=True)  # Language requirement flag or language department prefix
+    language_intro_level = db.Column(db.Integer, index=True)  # Introductory language course: 1-3, 0 for A/B/AA/BA, else NULL
+    
+    # Import bookkeeping (see importer.py)
+    content_hash = db.Column(db.String(40))  # SHA-1 of the mapped catalog fields, unchanged courses are not rewritten
+    is_active = db.Column(db.Boolean, nullable=False, default=True, server_default=text('1'))  # False once the course vanished from its term's feed
+    
     # Relationships
     user_preferences = db.relationship('UserCoursePreference', backref='course', lazy=True)
     winner_comparisons = db.relationship('SortComparison', foreign_keys='SortComparison.winner_course_id', backref='winner_course', lazy=True)
@@ -131,75 +259,149 @@ class Course(db.Model):
     
     def extract_course_number(self):
         """Extract numeric course number from course_number field (e.g., 'COMPSCI 50' -> 50, 'ARABIC A' -> None)"""
-        if not self.course_number:
-            return None
-        
-        # Split by space and get the last part (usually the number)
-        parts = self.course_number.strip().split()
-        if not parts:
-            return None
-        
-        # Get the last part (the course number)
-        last_part = parts[-1]
-        
-        # Check if it's purely numeric (not alpha like "A", "Crr")
-        if last_part.isdigit():
-            return int(last_part)
-        
-        # Extract digits from the last part (handles cases like "50A" -> 50)
-        digits = ''.join(filter(str.isdigit, last_part))
-        if digits:
-            return int(digits)
-        
-        return None
+        # Use the value stored at import time when available
+        if self.level is not None:
+            return self.course_num
+        return parse_course_number(self.course_number)
     
     def classify_level(self):
         """Classify course difficulty level based on course numbering system"""
-        # Check if it's a Gen Ed course first (these should be treated as Alpha)
-        if self.course_number and self.course_number.upper().startswith("GENED"):
-            return "Alpha"  # Gen Ed courses are open to all years, same as Alpha courses
-        
-        # Check course attributes first (more authoritative than course number)
-        # These attributes explicitly mark courses as graduate-level regardless of number
-        if self.class_level_attribute:
-            if self.class_level_attribute == "PRIMGRAD":
-                return "Grad_low"  # Primarily graduate course
-            elif self.class_level_attribute == "GRADCOURSE":
-                return "Grad_research"  # Graduate research course
-        
-        
-        # Now check course number
-        num = self.extract_course_number()
-        if num is None:
-            # Check if it's an alpha course (e.g., "Arabic A", "English Crr")
-            if self.course_number:
-                parts = self.course_number.split()
-                if parts and any(c.isalpha() for c in parts[-1]):
-                    return "Alpha"  # Alpha courses can be selected by any year
-            return "Unknown"
-        
-        # Special tutorial categories
-        if num in (97, 970):
-            return "SophomoreTutorial"
-        if num in (98, 980):
-            return "JuniorTutorial"
-        if num in (99, 990):
-            return "SeniorTutorial"
-        if num in (96, 960):
-            return "SpecialSeminar"
-        if num in (91, 910):
-            return "ReadingResearch"
-        
-        # General difficulty groups
-        if 1 <= num <= 99  or 1000 <= num <= 1099:
-            return "UG_intro"  # Introductory undergrad
-        if 100 <= num <= 199 or 1100 <= num <= 1999:
-            return "UG_mid"  # Undergrad/grad
-        if 200 <= num <= 299 or 2000 <= num <= 2999:
-            return "Grad_low"  # Primarily grad
-        if 300 <= num <= 399 or 3000 <= num <= 3999:
-            return "Grad_research"  # Graduate research
+        # Use the value stored at import time when available
+        if self.level is not None:
+            return self.level
+        return classify_course_level(self.course_number, self.class_level_attribute)
+    
+    def refresh_classification(self):
+        """Recompute the stored course number, level and flag columns from course_number"""
+        self.course_num = parse_course_number(self.course_number)
+        self.level = classify_course_level(self.course_number, self.class_level_attribute)
+        for column, value in classify_course_flags(
+            self.course_number, self.course_title, self.course_component, self.language_requirement
+        ).items():
+            setattr(self, column, value)
+
+
+def parse_course_number(course_number):
+    """Extract numeric course number from a course number string (e.g., 'COMPSCI 50' -> 50, 'ARABIC A' -> None)"""
+    if not course_number:
+        return None
+    
+    # Split by space and get the last part (usually the number)
+    parts = course_number.strip().split()
+    if not parts:
+        return None
+    
+    # Get the last part (the course number)
+    last_part = parts[-1]
+    
+    # Check if it's purely numeric (not alpha like "A", "Crr")
+    if last_part.isdigit():
+        return int(last_part)
+    
+    # Extract digits from the last part (handles cases like "50A" -> 50)
+    digits = ''.join(filter(str.isdigit, last_part))
+    if digits:
+        return int(digits)
+    
+    return None
+
+
+def classify_course_level(course_number, class_level_attribute):
+    """Classify course difficulty level based on course numbering system"""
+    # Check if it's a Gen Ed course first (these should be treated as Alpha)
+    if course_number and course_number.upper().startswith("GENED"):
+        return "Alpha"  # Gen Ed courses are open to all years, same as Alpha courses
+    
+    # Check course attributes first (more authoritative than course number)
+    # These attributes explicitly mark courses as graduate-level regardless of number
+    if class_level_attribute:
+        if class_level_attribute == "PRIMGRAD":
+            return "Grad_low"  # Primarily graduate course
+        elif class_level_attribute == "GRADCOURSE":
+            return "Grad_research"  # Graduate research course
+    
+    
+    # Now check course number
+    num = parse_course_number(course_number)
+    if num is None:
+        # Check if it's an alpha course (e.g., "Arabic A", "English Crr")
+        if course_number:
+            parts = course_number.split()
+            if parts and any(c.isalpha() for c in parts[-1]):
+                return "Alpha"  # Alpha courses can be selected by any year
         return "Unknown"
+    
+    # Special tutorial categories
+    if num in (97, 970):
+        return "SophomoreTutorial"
+    if num in (98, 980):
+        return "JuniorTutorial"
+    if num in (99, 990):
+        return "SeniorTutorial"
+    if num in (96, 960):
+        return "SpecialSeminar"
+    if num in (91, 910):
+        return "ReadingResearch"
+    
+    # General difficulty groups
+    if 1 <= num <= 99  or 1000 <= num <= 1099:
+        return "UG_intro"  # Introductory undergrad
+    if 100 <= num <= 199 or 1100 <= num <= 1999:
+        return "UG_mid"  # Undergrad/grad
+    if 200 <= num <= 299 or 2000 <= num <= 2999:
+        return "Grad_low"  # Primarily grad
+    if 300 <= num <= 399 or 3000 <= num <= 3999:
+        return "Grad_research"  # Graduate research
+    return "Unknown"
+
+
+# Common language department prefixes
+# Language courses typically have course numbers like "FRENCH 1", "SPANISH A", etc.
+LANGUAGE_PREFIXES = [
+    'FRENCH', 'SPANISH', 'ITALIAN', 'PORTUGUESE', 'GERMAN', 'CHINESE', 'JAPANESE',
+    'KOREAN', 'ARABIC', 'HEBREW', 'RUSSIAN', 'LATIN', 'GREEK', 'SANSKRIT',
+    'SWAHILI', 'YIDDISH', 'VIETNAMESE', 'THAI', 'HINDI', 'URDU', 'TURKISH',
+    'POLISH', 'CZECH', 'UKRAINIAN', 'SWEDISH', 'NORWEGIAN', 'DANISH', 'FINNISH',
+    'DUTCH', 'INDONESIAN', 'TAGALOG', 'AMHARIC', 'BENGALI', 'PERSIAN', 'TAMIL'
+]
+
+# Introductory language levels: numbers 1, 2, 3 and letter courses A, B, AA, BA
+INTRO_LANGUAGE_NUMBERS = (1, 2, 3)
+INTRO_LANGUAGE_LETTERS = ('A', 'B', 'AA', 'BA')
+
+
+def classify_course_flags(course_number, course_title, course_component, language_requirement):
+    """
+    Compute the stored recommendation flags for a course.
+    
+    Returns:
+        Dictionary with is_fysemr, is_tutorial, is_language_course and language_intro_level
+    """
+    course_number_upper = (course_number or '').upper()
+    
+    # Mirrors LIKE 'FYSEMR%' and ILIKE '%Tutorial%' (case-insensitive)
+    is_fysemr = course_number_upper.startswith('FYSEMR')
+    is_tutorial = course_component == 'Tutorial' or 'tutorial' in (course_title or '').lower()
+    
+    # Language course by flag or by course number prefix
+    is_language_course = bool(language_requirement) or course_number_upper.startswith(tuple(LANGUAGE_PREFIXES))
+    
+    # Introductory levels only matter for language courses
+    language_intro_level = None
+    if is_language_course:
+        num = parse_course_number(course_number)
+        parts = course_number_upper.strip().split()
+        if num in INTRO_LANGUAGE_NUMBERS:
+            language_intro_level = num
+        elif len(parts) > 1 and parts[-1] in INTRO_LANGUAGE_LETTERS:
+            language_intro_level = 0
+    
+    return {
+        'is_fysemr': is_fysemr,
+        'is_tutorial': is_tutorial,
+        'is_language_course': is_language_course,
+        'language_intro_level': language_intro_level,
+    }
 
 
 class UserCoursePreference(db.Model):
@@ -229,3 +431,143 @@ class SortComparison(db.Model):
     # Ensure we don't compare the same pair twice
     __table_args__ = (db.UniqueConstraint('user_id', 'winner_course_id', 'loser_course_id', name='unique_comparison'),)
 
+
+class CatalogVersion(db.Model):
+    """Single-row counter bumped after every catalog change; workers reload their catalog state when it moves"""
+    __tablename__ = 'catalog_version'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+
+def get_catalog_version():
+    """Return the current catalog version (0 before the first import); always reads the database"""
+    version = db.session.execute(select(CatalogVersion.version).where(CatalogVersion.id == 1)).scalar()
+    return version or 0
+
+
+def bump_catalog_version():
+    """
+    Increment the catalog version and commit.
+    
+    Returns:
+        The new version
+    """
+    updated = db.session.execute(
+        update(CatalogVersion).where(CatalogVersion.id == 1).values(version=CatalogVersion.version + 1)
+    )
+    if updated.rowcount == 0:
+        db.session.add(CatalogVersion(id=1, version=1))
+    db.session.commit()
+    return get_catalog_version()
+
+
+class RankingState(db.Model):
+    """Precomputed sorting game ranking for one user and term (see ranking.py)"""
+    __tablename__ = 'ranking_states'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    term_description = db.Column(db.String(50), nullable=False)
+    order_json = db.Column(db.Text)  # JSON array of course ids, best first
+    scores_json = db.Column(db.Text)  # JSON object course id -> wins minus losses
+    beats_json = db.Column(db.Text)  # JSON object winner course id -> array of loser course ids
+    closure_bits = db.Column(db.LargeBinary)  # Transitive closure bitsets, see ranking.pack_closure()
+    comparison_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'term_description', name='unique_user_term_ranking'),)
+
+
+def backfill_course_classification(refresh_all=False):
+    """
+    Compute the stored classification columns (course number, level and flags) for existing courses.
+    
+    Args:
+        refresh_all: Recompute every course instead of only unclassified ones
+    
+    Returns:
+        Number of courses updated
+    """
+    query = db.session.query(
+        Course.id, Course.course_number, Course.class_level_attribute,
+        Course.course_title, Course.course_component, Course.language_requirement
+    )
+    if not refresh_all:
+        query = query.filter(or_(Course.level.is_(None), Course.is_fysemr.is_(None)))
+    
+    rows = [
+        {
+            'id': row.id,
+            'course_num': parse_course_number(row.course_number),
+            'level': classify_course_level(row.course_number, row.class_level_attribute),
+            **classify_course_flags(row.course_number, row.course_title, row.course_component, row.language_requirement),
+        }
+        for row in query.all()
+    ]
+    if rows:
+        # ORM bulk UPDATE by primary key (one executemany instead of one UPDATE per object)
+        db.session.execute(update(Course), rows)
+        db.session.commit()
+    return len(rows)
+
+
+def migrate_json_preferences():
+    """
+    Move preferences from the legacy JSON columns on users into the user_* tables.
+    
+    Users whose JSON columns are all empty are skipped, and converted users have
+    them cleared, so running this again is safe.
+    
+    Returns:
+        Number of users converted
+    """
+    users = User.query.filter(or_(
+        User.term_preference.isnot(None),
+        User.concentration_preferences.isnot(None),
+        User.requirement_preferences.isnot(None),
+        User.school_preferences.isnot(None),
+    )).all()
+    for user in users:
+        user.set_terms(user._parse_json(user.term_preference))
+        user.set_concentrations(user._parse_json(user.concentration_preferences))
+        user.set_requirements(user._parse_json(user.requirement_preferences))
+        user.set_schools(user._parse_json(user.school_preferences))
+        user.term_preference = None
+        user.concentration_preferences = None
+        user.requirement_preferences = None
+        user.school_preferences = None
+    db.session.commit()
+    return len(users)
+
+
+def add_missing_columns():
+    """
+    Add model columns and indexes that are missing from existing tables.
+    
+    db.create_all() only creates missing tables, so databases created before a
+    column was introduced need an ALTER TABLE. Returns the list of added
+    "table.column" names.
+    """
+    inspector = inspect(db.engine)
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                definition = f'{column.name} {column_type}'
+                if column.server_default is not None:
+                    # Existing rows take the default (SQLite requires one for NOT NULL columns)
+                    if not column.nullable:
+                        definition += ' NOT NULL'
+                    definition += f' DEFAULT {column.server_default.arg.text}'
+                db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {definition}'))
+                added.append(f'{table.name}.{column.name}')
+        db.session.commit()
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    return added
@@ -0,0 +1,361 @@
+import json
+import random
+import struct
+
+from models import db, Course, RankingState, SortComparison
+
+
+def pack_closure(members, rows):
+    """Serialize closure bitsets: member count, member course ids, then one fixed-width row per member"""
+    width = (len(members) + 7) // 8
+    data = bytearray(struct.pack(f"<I{len(members)}I", len(members), *members))
+    for row in rows:
+        data += row.to_bytes(width, "little")
+    return bytes(data)
+
+
+def unpack_closure(data):
+    """Inverse of pack_closure(); returns (members, rows)"""
+    (count,) = struct.unpack_from("<I", data)
+    members = list(struct.unpack_from(f"<{count}I", data, 4))
+    width = (count + 7) // 8
+    offset = 4 + 4 * count
+    rows = [int.from_bytes(data[offset + i * width:offset + (i + 1) * width], "little") for i in range(count)]
+    return members, rows
+
+
+class TermRanking:
+    """
+    Incrementally maintained sorting game ranking for one user and term.
+
+    The order is kept as a linear extension of the comparison graph (every
+    winner above every course it beat). A comparison that contradicts the
+    order only reorders the courses between the two positions (Pearce-Kelly
+    dynamic topological sort), so reading the ranking never replays the
+    comparison history.
+
+    A transitive closure is kept alongside: one bitset row per compared course
+    with a bit set for every course it beat directly or transitively, so
+    "is the order of X and Y already implied?" is a single bit test.
+    """
+
+    def __init__(self, order=None, scores=None, beats=None, comparison_count=0, beats_json=None, closure=None):
+        self.order = list(order or [])
+        self.scores = dict(scores or {})  # course id -> wins minus losses
+        self.comparison_count = comparison_count
+        # winner course id -> set of loser course ids; parsed lazily, the matches page doesn't need it
+        self._beats = {winner: set(losers) for winner, losers in beats.items()} if beats is not None else None
+        self._beats_json = beats_json
+        self._beaten_by = None
+        self._positions = None
+        # Closure bitsets: self._rows[i] has bit j set if self._members[i] beats self._members[j]
+        self._closure = closure
+        self._members = None
+        self._member_index = None
+        self._rows = None
+
+    @classmethod
+    def from_state(cls, state):
+        """Load a ranking from its RankingState row"""
+        return cls(
+            order=json.loads(state.order_json or "[]"),
+            scores={int(course_id): score for course_id, score in json.loads(state.scores_json or "{}").items()},
+            comparison_count=state.comparison_count or 0,
+            beats_json=state.beats_json,
+            closure=state.closure_bits,
+        )
+
+    def to_state(self, state):
+        """Write the ranking back to its RankingState row"""
+        state.order_json = json.dumps(self.order)
+        state.scores_json = json.dumps(self.scores)
+        if self._beats is not None:
+            state.beats_json = json.dumps({winner: sorted(losers) for winner, losers in self._beats.items()})
+        if self._rows is not None:
+            state.closure_bits = pack_closure(self._members, self._rows)
+        state.comparison_count = self.comparison_count
+
+    @property
+    def beats(self):
+        if self._beats is None:
+            self._beats = {
+                int(winner): set(losers)
+                for winner, losers in json.loads(self._beats_json or "{}").items()
+            }
+        return self._beats
+
+    @property
+    def beaten_by(self):
+        if self._beaten_by is None:
+            self._beaten_by = {}
+            for winner, losers in self.beats.items():
+                for loser in losers:
+                    self._beaten_by.setdefault(loser, set()).add(winner)
+        return self._beaten_by
+
+    @property
+    def positions(self):
+        if self._positions is None:
+            self._positions = {course_id: index for index, course_id in enumerate(self.order)}
+        return self._positions
+
+    def _load_closure(self):
+        if self._rows is not None:
+            return
+        if self._closure:
+            self._members, self._rows = unpack_closure(self._closure)
+            self._member_index = {course_id: index for index, course_id in enumerate(self._members)}
+        else:
+            self._rebuild_closure()
+
+    def _rebuild_closure(self):
+        """Recompute the closure from the beats lists, walking the order bottom-up"""
+        self._members = list(self.order)
+        self._member_index = {course_id: index for index, course_id in enumerate(self._members)}
+        self._rows = [0] * len(self._members)
+        for index in range(len(self._members) - 1, -1, -1):
+            row = 0
+            for loser_id in self.beats.get(self._members[index], ()):
+                loser_index = self._member_index.get(loser_id)
+                # Answers that contradict the order (cycles) are left out
+                if loser_index is not None and loser_index > index:
+                    row |= (1 << loser_index) | self._rows[loser_index]
+            self._rows[index] = row
+
+    def _member(self, course_id):
+        """Closure index of course_id, adding an empty row for a new course"""
+        index = self._member_index.get(course_id)
+        if index is None:
+            index = len(self._members)
+            self._members.append(course_id)
+            self._member_index[course_id] = index
+            self._rows.append(0)
+        return index
+
+    def is_implied(self, better_id, worse_id):
+        """True if earlier answers already rank better_id above worse_id (directly or transitively)"""
+        self._load_closure()
+        better = self._member_index.get(better_id)
+        worse = self._member_index.get(worse_id)
+        return better is not None and worse is not None and (self._rows[better] >> worse) & 1 == 1
+
+    def _neutral_position(self):
+        """Index of the first course with a losing record, where courses without comparisons belong"""
+        return next((index for index, course_id in enumerate(self.order) if self.scores.get(course_id, 0) < 0),
+                    len(self.order))
+
+    def add_comparison(self, winner_id, loser_id):
+        """Apply a new comparison (winner_id beat loser_id)"""
+        # The answer contradicts earlier ones (A > B > C, then C > A): keep it out of the closure and order
+        contradicts = self.is_implied(loser_id, winner_id)
+
+        self.comparison_count += 1
+        self.scores[winner_id] = self.scores.get(winner_id, 0) + 1
+        self.scores[loser_id] = self.scores.get(loser_id, 0) - 1
+        self.beats.setdefault(winner_id, set()).add(loser_id)
+        if self._beaten_by is not None:
+            self._beaten_by.setdefault(loser_id, set()).add(winner_id)
+
+        if not contradicts:
+            # winner_id and everything that beat it now also beat loser_id and everything below it
+            winner = self._member(winner_id)
+            loser = self._member(loser_id)
+            gained = (1 << loser) | self._rows[loser]
+            winner_bit = 1 << winner
+            for index, row in enumerate(self._rows):
+                if index == winner or row & winner_bit:
+                    self._rows[index] = row | gained
+
+        positions = self.positions
+        if winner_id not in positions and loser_id not in positions:
+            # First comparison for both: place them where the win-count fallback would
+            at = self._neutral_position()
+            self.order[at:at] = [winner_id, loser_id]
+        elif winner_id not in positions:
+            self.order.insert(positions[loser_id], winner_id)
+        elif loser_id not in positions:
+            self.order.insert(positions[winner_id] + 1, loser_id)
+        else:
+            if positions[winner_id] > positions[loser_id] and not contradicts:
+                self._reorder(winner_id, loser_id)
+            return
+        self._positions = None
+
+    def _reorder(self, winner_id, loser_id):
+        """Move courses so winner_id ends up above loser_id, touching only the affected window"""
+        positions = self.positions
+        lower = positions[loser_id]
+        upper = positions[winner_id]
+        winner_bit = 1 << self._member_index[winner_id]
+        loser_row = self._rows[self._member_index[loser_id]]
+        # loser_id and what it (transitively) beat, among the courses placed no lower than winner_id
+        forward = [loser_id] + [
+            course_id for index, course_id in enumerate(self._members)
+            if (loser_row >> index) & 1 and positions[course_id] <= upper
+        ]
+        # winner_id and what (transitively) beat it, among the courses placed no higher than loser_id
+        backward = [winner_id] + [
+            course_id for index, course_id in enumerate(self._members)
+            if self._rows[index] & winner_bit and positions[course_id] >= lower
+        ]
+        moved = sorted(backward, key=positions.get) + sorted(forward, key=positions.get)
+        slots = sorted(positions[course_id] for course_id in moved)
+        for slot, course_id in zip(slots, moved):
+            self.order[slot] = course_id
+            positions[course_id] = slot
+
+    def remove_comparison(self, winner_id, loser_id):
+        """Revert a comparison (used by undo); removing a constraint never invalidates the order"""
+        self.comparison_count = max(0, self.comparison_count - 1)
+        self.scores[winner_id] = self.scores.get(winner_id, 0) - 1
+        self.scores[loser_id] = self.scores.get(loser_id, 0) + 1
+        losers = self.beats.get(winner_id)
+        if losers is not None:
+            losers.discard(loser_id)
+            if not losers:
+                del self.beats[winner_id]
+        winners = self.beaten_by.get(loser_id)
+        if winners is not None:
+            winners.discard(winner_id)
+            if not winners:
+                del self.beaten_by[loser_id]
+
+        # Courses left without comparisons are placed like never-compared courses again
+        for course_id in (winner_id, loser_id):
+            if course_id not in self.beats and course_id not in self.beaten_by and course_id in self.positions:
+                self.order.remove(course_id)
+                self.scores.pop(course_id, None)
+                self._positions = None
+
+        # Reachability can't be decremented bit by bit, so recompute it from the remaining answers
+        self._rebuild_closure()
+
+    def rankings(self, course_ids):
+        """
+        Rank the given courses (e.g., the user's saved courses in this term).
+
+        Courses without comparisons are placed between the courses with a winning
+        and a losing record, in the order given.
+
+        Returns:
+            Dictionary mapping course_id to rank (0 = best)
+        """
+        saved = set(course_ids)
+        ranked = [course_id for course_id in self.order if course_id in saved]
+        unranked = [course_id for course_id in course_ids if course_id not in self.positions]
+        if unranked:
+            at = next((index for index, course_id in enumerate(ranked) if self.scores.get(course_id, 0) < 0),
+                      len(ranked))
+            ranked[at:at] = unranked
+        return {course_id: rank for rank, course_id in enumerate(ranked)}
+
+    def next_comparison(self, course_ids, rng=random):
+        """
+        Propose the most informative comparison among the given courses without enumerating all pairs.
+        
+        Each ranked course can only move up as far as the course right after the lowest
+        course known to beat it (directly or transitively); the courses in between are
+        its uncertain window. Like binary insertion, the course is compared with the
+        middle of its window, so each answer halves it. Courses that were never
+        compared have the whole ranked list as their window.
+        
+        Returns:
+            (course_id, course_id) tuple in random display order, or None once the order is fully determined
+        """
+        saved = set(course_ids)
+        ranked = [course_id for course_id in self.order if course_id in saved]
+        unranked = [course_id for course_id in course_ids if course_id not in self.positions]
+        
+        if not ranked:
+            pair = rng.sample(unranked, 2) if len(unranked) >= 2 else None
+        elif unranked:
+            # Insert a new course: probe the middle of the ranked list
+            pair = [rng.choice(unranked), ranked[len(ranked) // 2]]
+        else:
+            candidates = []
+            window_sizes = []
+            for position, course_id in enumerate(ranked):
+                # Walk up until a course that is already known to rank higher
+                start = position
+                while start > 0 and not self.is_implied(ranked[start - 1], course_id):
+                    start -= 1
+                if position > start:
+                    candidates.append((course_id, start, position))
+                    window_sizes.append(position - start)
+            if not candidates:
+                return None
+            # Favor the widest windows, but vary the pick so "skip" shows a different pair
+            course_id, start, end = rng.choices(candidates, weights=window_sizes)[0]
+            pair = [course_id, ranked[(start + end - 1) // 2]]
+        
+        if pair is None:
+            return None
+        if rng.random() < 0.5:
+            pair.reverse()
+        return tuple(pair)
+
+
+def load_term_rankings(user_id):
+    """Return {term: TermRanking} for every term the user has compared courses in"""
+    states = RankingState.query.filter_by(user_id=user_id).all()
+    return {state.term_description: TermRanking.from_state(state) for state in states}
+
+
+def _ranking_state_for(user_id, term):
+    """Get or create the RankingState row for a user and term"""
+    state = RankingState.query.filter_by(user_id=user_id, term_description=term).first()
+    if state is None:
+        state = RankingState(user_id=user_id, term_description=term, comparison_count=0)
+        db.session.add(state)
+    return state
+
+
+def record_comparison(user_id, term, winner_id, loser_id):
+    """Update the stored ranking for a new SortComparison row. The caller commits."""
+    state = _ranking_state_for(user_id, term)
+    ranking = TermRanking.from_state(state)
+    ranking.add_comparison(winner_id, loser_id)
+    ranking.to_state(state)
+
+
+def forget_comparison(user_id, term, winner_id, loser_id):
+    """Update the stored ranking for a deleted SortComparison row. The caller commits."""
+    state = RankingState.query.filter_by(user_id=user_id, term_description=term).first()
+    if state is None:
+        return
+    ranking = TermRanking.from_state(state)
+    ranking.remove_comparison(winner_id, loser_id)
+    ranking.to_state(state)
+
+
+def rebuild_rankings(user_id=None):
+    """
+    Recompute ranking state by replaying SortComparison rows in the order they were made.
+
+    Args:
+        user_id: Only rebuild this user's rankings (default: every user)
+
+    Returns:
+        Number of (user, term) rankings written
+    """
+    states = RankingState.query
+    comparisons = db.session.query(
+        SortComparison.user_id, Course.term_description, SortComparison.winner_course_id, SortComparison.loser_course_id
+    ).join(Course, Course.id == SortComparison.winner_course_id)
+    if user_id is not None:
+        states = states.filter_by(user_id=user_id)
+        comparisons = comparisons.filter(SortComparison.user_id == user_id)
+    states.delete()
+
+    rankings = {}
+    for comparison_user_id, term, winner_id, loser_id in comparisons.order_by(SortComparison.timestamp, SortComparison.id):
+        # Same fallback term as the matches page groups by
+        ranking = rankings.setdefault((comparison_user_id, term or "Other"), TermRanking(beats={}))
+        ranking.add_comparison(winner_id, loser_id)
+
+    for (comparison_user_id, term), ranking in rankings.items():
+        state = RankingState(user_id=comparison_user_id, term_description=term)
+        ranking.to_state(state)
+        db.session.add(state)
+    db.session.commit()
+    return len(rankings)
@@ -0,0 +1,192 @@
+import heapq
+import random
+from bisect import bisect_right
+from itertools import accumulate, compress
+from operator import itemgetter
+
+
+# Weight of each course level by class year (a weight of n makes a course n times as likely).
+# Levels missing from a year's table get weight 0 and are never shown to that year.
+YEAR_LEVEL_WEIGHTS = {
+    "freshman": {
+        "UG_intro": 8,  # Heavy on UG_intro (1-99, 1000-1099)
+        "UG_mid": 2,  # Moderate weight on UG_mid (100-199, 1100-1999)
+        "Alpha": 2,  # Alpha courses available to all
+        # NO Grad_low or Grad_research for freshmen
+        # NO tutorials, special seminars, or reading research for freshmen
+    },
+    "sophomore": {
+        "UG_intro": 5,  # Less highly than freshmen, but not too low
+        "UG_mid": 5,  # More highly than UG_intro
+        "SophomoreTutorial": 2,  # 97, 970
+        "SpecialSeminar": 2,  # 96, 960
+        "ReadingResearch": 2,  # 91, 910
+        "Alpha": 2,  # Same across all years
+        # NO Grad_low or Grad_research for sophomores
+    },
+    "junior": {
+        "UG_intro": 2,  # Very low
+        "UG_mid": 8,  # Highly (more than sophomores)
+        "Grad_low": 3,  # 200-299, 2000-2999: higher than UG_intro but lower than UG_mid
+        "JuniorTutorial": 2,  # 98, 980
+        "SpecialSeminar": 2,  # 96, 960
+        "ReadingResearch": 2,  # 91, 910
+        "Alpha": 2,  # Same across all years
+        # NO Grad_research for juniors
+    },
+    "senior": {
+        "UG_intro": 1,  # Very low (lowest of all years, practically never display)
+        "UG_mid": 7,  # Highly (more than juniors)
+        "Grad_low": 6,  # 200-299, 2000-2999: highly (more than juniors)
+        "SeniorTutorial": 2,  # 99, 990
+        "SpecialSeminar": 2,  # 96, 960
+        "ReadingResearch": 2,  # 91, 910
+        "Alpha": 2,  # Same across all years
+        # NO Grad_research for seniors
+    },
+}
+
+# First Year Seminars only get weight for freshmen.
+# Lower weight (1) prevents FYSEMR courses from dominating when many are available.
+FYSEMR_WEIGHTS = {
+    "freshman": 1,
+}
+
+
+# Level classes in feature-code order (see classify_course_level); unlisted levels score as "Unknown"
+LEVEL_CLASSES = [
+    "UG_intro", "UG_mid", "Grad_low", "Grad_research",
+    "SophomoreTutorial", "JuniorTutorial", "SeniorTutorial",
+    "SpecialSeminar", "ReadingResearch", "Alpha", "Unknown",
+]
+LEVEL_CODES = {level: code for code, level in enumerate(LEVEL_CLASSES)}
+# Feature code of First Year Seminars, scored with FYSEMR_WEIGHTS instead of their level
+FYSEMR_CODE = len(LEVEL_CLASSES)
+
+
+def weight_code(level, is_fysemr=False):
+    """Feature code of a course: FYSEMR_CODE for First Year Seminars, else its level's position in LEVEL_CLASSES"""
+    if is_fysemr:
+        return FYSEMR_CODE
+    return LEVEL_CODES.get(level, LEVEL_CODES["Unknown"])
+
+
+def _weight_vectors():
+    """Per-year weight vectors indexed by feature code (the last entry is the FYSEMR weight)"""
+    return {
+        year: tuple(YEAR_LEVEL_WEIGHTS[year].get(level, 0) for level in LEVEL_CLASSES)
+        + (FYSEMR_WEIGHTS.get(year, 0),)
+        for year in YEAR_LEVEL_WEIGHTS
+    }
+
+
+YEAR_WEIGHT_VECTORS = _weight_vectors()
+# Years without a table (None, graduate students) give every course weight 0
+ZERO_WEIGHT_VECTOR = (0,) * (FYSEMR_CODE + 1)
+
+
+def weight_vector(year):
+    """Weight vector for a class year (e.g., "Freshman"), case-insensitive"""
+    return YEAR_WEIGHT_VECTORS.get(year.lower() if year else None, ZERO_WEIGHT_VECTOR)
+
+
+def course_weight(year, level, is_fysemr=False):
+    """
+    Look up the selection weight of a course for a class year.
+
+    Args:
+        year: Class year (e.g., "Freshman"), case-insensitive
+        level: Level class from Course.classify_level()
+        is_fysemr: Whether the course is a First Year Seminar
+
+    Returns:
+        Integer weight (0 = never shown)
+    """
+    return weight_vector(year)[weight_code(level, is_fysemr)]
+
+
+def score_codes(codes, years):
+    """
+    Weight a candidate pool for one or more class years in one call.
+
+    Each year's weights are a single gather over its weight vector
+    (operator.itemgetter runs the loop in C), so scoring doesn't walk the
+    per-course level rules in Python.
+
+    Args:
+        codes: Feature codes of the candidates, from weight_code()
+        years: Class years to score the pool for
+
+    Returns:
+        List with one tuple of weights per year, parallel to codes
+    """
+    if not codes:
+        return [() for _ in years]
+    gather = itemgetter(*codes)
+    if len(codes) == 1:
+        return [(gather(weight_vector(year)),) for year in years]
+    return [gather(weight_vector(year)) for year in years]
+
+
+class WeightedSampler:
+    """
+    Weighted random selection over (item, weight) pairs.
+
+    Uses cumulative weights and binary search, so an item with weight n is n
+    times as likely as an item with weight 1 without copying it n times.
+    """
+
+    def __init__(self, pairs):
+        self.items = []
+        weights = []
+        for item, weight in pairs:
+            # Weight 0 (or less) means the item is never drawn
+            if weight > 0:
+                self.items.append(item)
+                weights.append(weight)
+        self.weights = weights
+        self.cum_weights = list(accumulate(weights))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    @classmethod
+    def from_columns(cls, items, weights):
+        """Build a sampler from parallel item and weight sequences (weights must not be negative)"""
+        sampler = cls(())
+        # compress() drops the weight-0 items without a Python-level loop
+        sampler.items = list(compress(items, weights))
+        sampler.weights = list(filter(None, weights))
+        sampler.cum_weights = list(accumulate(sampler.weights))
+        return sampler
+
+    @property
+    def total_weight(self):
+        return self.cum_weights[-1] if self.cum_weights else 0
+
+    def choice(self, rng=random):
+        """Draw one item, or None if the sampler is empty"""
+        if not self.items:
+            return None
+        target = rng.random() * self.total_weight
+        return self.items[bisect_right(self.cum_weights, target)]
+
+    def sample(self, k, rng=random):
+        """
+        Draw up to k distinct items, most likely first.
+
+        Equivalent to k successive weighted draws without replacement
+        (Efraimidis-Spirakis: keep the k largest keys u ** (1 / weight)).
+        """
+        if k <= 0 or not self.items:
+            return []
+        if k == 1:
+            return [self.choice(rng)]
+        keyed = (
+            (rng.random() ** (1.0 / weight), position)
+            for position, weight in enumerate(self.weights)
+        )
+        return [self.items[position] for _, position in heapq.nlargest(k, keyed)]
@@ -0,0 +1,63 @@
+class SeenSet:
+    """
+    Compact set of course ids stored as a bitmap (bit n set = course id n seen).
+
+    Membership is a byte lookup, so filtering candidates costs the same no
+    matter how many courses the user has already swiped.
+    """
+
+    __slots__ = ("_bits",)
+
+    def __init__(self, data=b""):
+        self._bits = bytearray(data or b"")
+
+    @classmethod
+    def from_ids(cls, course_ids):
+        seen = cls()
+        for course_id in course_ids:
+            seen.add(course_id)
+        return seen
+
+    def to_bytes(self):
+        # Trailing zero bytes carry no information
+        return bytes(self._bits.rstrip(b"\x00"))
+
+    def __contains__(self, course_id):
+        byte = course_id >> 3
+        return 0 <= byte < len(self._bits) and bool(self._bits[byte] & (1 << (course_id & 7)))
+
+    def __len__(self):
+        return sum(bin(byte).count("1") for byte in self._bits)
+
+    def __bool__(self):
+        return any(self._bits)
+
+    def __iter__(self):
+        for byte_index, byte in enumerate(self._bits):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte & (1 << bit):
+                    yield (byte_index << 3) | bit
+
+    def add(self, course_id):
+        if course_id < 0:
+            raise ValueError(f"course id must be non-negative, got {course_id}")
+        byte = course_id >> 3
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(byte - len(self._bits) + 1))
+        self._bits[byte] |= 1 << (course_id & 7)
+
+    def discard(self, course_id):
+        byte = course_id >> 3
+        if 0 <= byte < len(self._bits):
+            self._bits[byte] &= ~(1 << (course_id & 7)) & 0xFF
+
+    def exclude(self, course_ids):
+        """Return the ids from course_ids that are not in this set"""
+        bits = self._bits
+        size = len(bits)
+        return {
+            course_id for course_id in course_ids
+            if (course_id >> 3) >= size or not bits[course_id >> 3] & (1 << (course_id & 7))
+        }
@@ -69,3 +69,239 @@ function closeWelcomePopup() {
         sessionStorage.setItem('welcomePopupDismissed', 'true');
     }
 }
+
+// Discover: keep a few cards prefetched as JSON and show the next one without a page load.
+// Swipes are posted to /api/swipes in the background. Swipes made while a batch is in flight
+// go out together in the next batch, and batches are sent one at a time, so /discover/undo
+// (which undoes the newest swipe by timestamp) sees them in the order they were made.
+// The swipe and undo forms still post normally without JavaScript or when a request fails.
+const DISCOVER_PREFETCH = 3;
+// A failed batch is retried this many times (after 0.5s, 1s, ...) before its swipes are replayed one by one
+const SWIPE_BATCH_RETRIES = 2;
+const SWIPE_RETRY_DELAY_MS = 500;
+
+const discoverState = {
+    queue: [],                   // prefetched cards, next first
+    shownIds: new Set(),         // cards shown or queued on this page (the deck may draw one again)
+    fetching: null,              // in-flight /api/discover/next request
+    exhausted: false,            // the server returned no more cards
+    unsent: [],                  // swipes waiting for the next batch
+    swipes: Promise.resolve(),   // chain of /api/swipes requests
+};
+
+document.addEventListener('DOMContentLoaded', function() {
+    const card = document.getElementById('course-card');
+    if (!card || !window.fetch) {
+        return;
+    }
+    discoverState.shownIds.add(Number(card.dataset.courseId));
+
+    document.querySelectorAll('form[data-swipe-form]').forEach(form => {
+        form.addEventListener('submit', handleSwipeSubmit);
+    });
+    const undoForm = document.querySelector('form[data-undo-form]');
+    if (undoForm) {
+        undoForm.addEventListener('submit', handleUndoSubmit);
+    }
+    prefetchCards();
+});
+
+function isJsonResponse(response) {
+    // A logged-out request is redirected to the login page, which is HTML
+    return response.ok && (response.headers.get('Content-Type') || '').includes('application/json');
+}
+
+// Fetch cards until DISCOVER_PREFETCH are queued; returns the in-flight request
+function prefetchCards() {
+    if (discoverState.fetching) {
+        return discoverState.fetching;
+    }
+    const wanted = DISCOVER_PREFETCH - discoverState.queue.length;
+    if (wanted <= 0 || discoverState.exhausted) {
+        return Promise.resolve();
+    }
+
+    discoverState.fetching = fetch(`/api/discover/next?n=${wanted}`, { credentials: 'same-origin' })
+        .then(response => {
+            if (!isJsonResponse(response)) {
+                throw new Error('prefetch failed');
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (data.cards.length === 0) {
+                discoverState.exhausted = true;
+            }
+            data.cards.forEach(card => {
+                if (!discoverState.shownIds.has(card.id)) {
+                    discoverState.shownIds.add(card.id);
+                    discoverState.queue.push(card);
+                }
+            });
+        })
+        .catch(() => {
+            // Leave the queue as is; an empty queue falls back to loading /discover
+        })
+        .finally(() => {
+            discoverState.fetching = null;
+        });
+    return discoverState.fetching;
+}
+
+function handleSwipeSubmit(event) {
+    const action = event.submitter && event.submitter.value;
+    if (!action) {
+        // Browser without SubmitEvent.submitter - let the form post
+        return;
+    }
+    event.preventDefault();
+    const courseId = Number(event.target.elements.course_id.value);
+    postSwipe(courseId, action);
+    showNextCard();
+}
+
+function postSwipe(courseId, action) {
+    discoverState.unsent.push({
+        course_id: courseId,
+        action: action,
+        // Monotonic clock, so the server can't be misled by clock changes between swipes
+        client_ts: performance.timeOrigin + performance.now(),
+    });
+    discoverState.swipes = discoverState.swipes.then(sendSwipes);
+}
+
+function sendSwipes(attempt = 0) {
+    const batch = discoverState.unsent.splice(0);
+    if (batch.length === 0) {
+        // Already sent with an earlier batch
+        return;
+    }
+    return postJson('/api/swipes', { swipes: batch })
+        .catch(() => {
+            // The batch is one transaction, so nothing was recorded
+            if (attempt < SWIPE_BATCH_RETRIES) {
+                // Put it back ahead of newer swipes and send them all together after a pause
+                discoverState.unsent.unshift(...batch);
+                const delay = SWIPE_RETRY_DELAY_MS * 2 ** attempt;
+                return new Promise(resolve => setTimeout(resolve, delay)).then(() => sendSwipes(attempt + 1));
+            }
+            return replaySwipes(batch);
+        });
+}
+
+// Post every swipe of a failed batch on its own, in order, through /api/swipe or else the form
+function replaySwipes(batch) {
+    return batch.reduce(
+        (chain, swipe) => chain.then(() =>
+            postJson('/api/swipe', { course_id: swipe.course_id, action: swipe.action })
+                .catch(() => submitSwipeForm(swipe.course_id, swipe.action))
+        ),
+        Promise.resolve()
+    );
+}
+
+function postJson(url, payload) {
+    return fetch(url, {
+        method: 'POST',
+        credentials: 'same-origin',
+        keepalive: true,
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload),
+    }).then(response => {
+        if (!isJsonResponse(response)) {
+            throw new Error('swipe failed');
+        }
+    });
+}
+
+// Fallback: post the swipe with a regular form, which records it and loads /discover
+function submitSwipeForm(courseId, action) {
+    const form = document.createElement('form');
+    form.method = 'POST';
+    form.action = '/swipe';
+    [['course_id', courseId], ['action', action]].forEach(([name, value]) => {
+        const input = document.createElement('input');
+        input.type = 'hidden';
+        input.name = name;
+        input.value = value;
+        form.appendChild(input);
+    });
+    document.body.appendChild(form);
+    form.submit();
+}
+
+function showNextCard() {
+    const next = discoverState.queue.shift();
+    if (next) {
+        renderCard(next);
+        prefetchCards();
+        return;
+    }
+    // The queue ran dry: wait for the prefetch, or let the server render the "no more courses" page
+    prefetchCards().then(() => {
+        const card = discoverState.queue.shift();
+        if (card) {
+            renderCard(card);
+            prefetchCards();
+        } else {
+            reloadDiscover();
+        }
+    });
+}
+
+function reloadDiscover() {
+    discoverState.swipes.then(() => {
+        window.location.href = '/discover';
+    });
+}
+
+// Undo goes through the form once the swipes still being posted have been recorded
+function handleUndoSubmit(event) {
+    event.preventDefault();
+    const form = event.target;
+    discoverState.swipes.then(() => form.submit());
+}
+
+function setField(card, name, text) {
+    const element = card.querySelector(`[data-field="${name}"]`);
+    if (element) {
+        element.textContent = text;
+    }
+}
+
+function renderCard(course) {
+    const card = document.getElementById('course-card');
+    card.dataset.courseId = course.id;
+
+    setField(card, 'course_number', course.course_number);
+    setField(card, 'course_title', course.course_title);
+    setField(card, 'instructor_name', course.instructor_name || 'TBA');
+    setField(card, 'term_description', course.term_description);
+    setField(card, 'department', course.department);
+    setField(card, 'time', course.start_time && course.end_time
+        ? `${course.start_time} – ${course.end_time}` : 'TBA');
+
+    const link = card.querySelector('[data-field="course_url"]');
+    if (link) {
+        link.href = course.course_url || '';
+    }
+    // Catalog descriptions are HTML; the template renders them unescaped too
+    const description = card.querySelector('[data-field="description"]');
+    if (description) {
+        description.innerHTML = course.description || 'No description available.';
+    }
+    card.querySelectorAll('[data-day]').forEach(day => {
+        day.classList.toggle('active', course.days.includes(day.dataset.day));
+    });
+
+    // Student quotes belong to the server-rendered course only
+    const quotes = card.querySelector('.quotes-section');
+    if (quotes) {
+        quotes.remove();
+    }
+
+    card.querySelectorAll('form[data-swipe-form] input[name="course_id"]').forEach(input => {
+        input.value = course.id;
+    });
+    window.scrollTo(0, 0);
+}
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """The Flask app, pointed at a fresh temporary database and session directory"""
+    database = tmp_path_factory.mktemp("db") / "classcupid.db"
+    os.environ["CLASSCUPID_DATABASE_URI"] = f"sqlite:///{database}"
+    # Session files would otherwise land in flask_session/ under the working directory
+    os.environ["CLASSCUPID_SESSION_DIR"] = str(tmp_path_factory.mktemp("sessions"))
+    import app as app_module
+    app_module.app.config["TESTING"] = True
+    return app_module.app
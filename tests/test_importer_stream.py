@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from importer import iter_catalog_courses, map_catalog_files
+
+CATALOG = (
+    '{"count": 2, "courses": [{"courseID": "1", "units": 4.0, "n": -12, "big": 1.5e+3},'
+    ' {"courseID": "2", "meetings": [{"startTime": "9:00am"}], "ok": true, "x": null}],'
+    ' "n": 5.5, "e": 2E-2, "tail": [10, 0.25]}'
+)
+
+
+@pytest.mark.parametrize("text", [CATALOG, '{"courses":[{"a":1}], "n": 5.5}', '{"courses": []}', '{}'])
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 5, 7, 64])
+def test_streamed_courses_match_json_load(tmp_path, text, chunk_size):
+    path = tmp_path / "catalog.json"
+    path.write_text(text, encoding="utf-8")
+    expected = json.loads(text).get("courses", [])
+    assert list(iter_catalog_courses(str(path), chunk_size=chunk_size)) == expected
+
+
+def test_sequential_mapping_reports_a_malformed_file_and_continues(tmp_path):
+    bad = tmp_path / "bad_courses.json"
+    bad.write_text('{"courses": [["not", "an", "object"]]}', encoding="utf-8")
+    good = tmp_path / "good_courses.json"
+    good.write_text('{"courses": [{"courseID": "1", "termDescription": "2025 Fall"}]}', encoding="utf-8")
+
+    results = list(map_catalog_files([str(bad), str(good)], batch_size=10, workers=1))
+
+    errors = {json_file: error for json_file, batch, _, error in results if batch is None}
+    assert errors[str(bad)]
+    assert errors[str(good)] is None
+    assert [course["course_id"] for _, batch, _, _ in results if batch for course in batch] == ["1"]
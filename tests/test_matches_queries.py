@@ -0,0 +1,62 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from models import db, User, Course, UserCoursePreference, SortComparison
+from ranking import record_comparison
+
+TERM = "2025 Fall"
+
+
+def make_user(username, saved_count, comparisons):
+    """User with saved_count hearted/starred courses in TERM, the first few ranked by comparisons"""
+    user = User(username=username, password_hash="x")
+    user.set_terms([TERM])
+    db.session.add(user)
+    courses = [
+        Course(course_id=f"{username}-{n}", course_number=f"COMPSCI {n}", course_title=f"Course {n}",
+               term_description=TERM)
+        for n in range(saved_count)
+    ]
+    db.session.add_all(courses)
+    db.session.flush()
+    for n, course in enumerate(courses):
+        db.session.add(UserCoursePreference(user_id=user.id, course_id=course.id,
+                                            status="star" if n % 2 else "heart"))
+    if comparisons:
+        for winner, loser in zip(courses, courses[1:4]):
+            db.session.add(SortComparison(user_id=user.id, winner_course_id=winner.id, loser_course_id=loser.id))
+            record_comparison(user.id, TERM, winner.id, loser.id)
+    db.session.commit()
+    return user.id
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.mark.parametrize("comparisons", [False, True])
+def test_matches_statement_count_does_not_grow_with_saved_courses(app, comparisons):
+    counts = {}
+    for saved_count in (2, 10, 40):
+        with app.app_context():
+            user_id = make_user(f"matches-{comparisons}-{saved_count}", saved_count, comparisons)
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session["user_id"] = user_id
+            with count_statements() as statements:
+                response = client.get("/matches")
+            assert response.status_code == 200
+            counts[saved_count] = len(statements)
+    assert len(set(counts.values())) == 1, counts
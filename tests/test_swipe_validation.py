@@ -0,0 +1,57 @@
+import pytest
+
+from models import db, User, Course, UserCoursePreference
+
+
+@pytest.fixture
+def client(app):
+    with app.app_context():
+        user = User(username="swiper", password_hash="x")
+        course = Course(course_id="swipe-1", course_number="COMPSCI 50", course_title="CS50",
+                        term_description="2025 Fall")
+        db.session.add_all([user, course])
+        db.session.commit()
+        user_id, course_id = user.id, course.id
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = user_id
+    client.user_id, client.course_id = user_id, course_id
+    yield client
+    with app.app_context():
+        UserCoursePreference.query.filter_by(user_id=user_id).delete()
+        db.session.delete(db.session.get(User, user_id))
+        db.session.delete(db.session.get(Course, course_id))
+        db.session.commit()
+
+
+BAD_IDS = [0, -3, 10**8, 2**63 - 1, 2**63, 10**30]
+
+
+@pytest.mark.parametrize("course_id", BAD_IDS)
+def test_api_swipe_rejects_bad_course_ids(client, course_id):
+    response = client.post("/api/swipe", json={"course_id": course_id, "action": "heart"})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("course_id", BAD_IDS)
+def test_api_swipes_rejects_batch_with_bad_course_id(app, client, course_id):
+    swipes = [{"course_id": client.course_id, "action": "heart", "client_ts": 1},
+              {"course_id": course_id, "action": "star", "client_ts": 2}]
+    response = client.post("/api/swipes", json={"swipes": swipes})
+    assert response.status_code == 400
+    with app.app_context():
+        assert UserCoursePreference.query.filter_by(user_id=client.user_id).count() == 0
+
+
+@pytest.mark.parametrize("course_id", ["-1", str(10**8), str(2**63)])
+def test_swipe_form_rejects_bad_course_ids(client, course_id):
+    response = client.post("/swipe", data={"course_id": course_id, "action": "heart"})
+    assert response.status_code == 400
+
+
+def test_api_swipes_records_known_course(app, client):
+    response = client.post("/api/swipes", json={"swipes": [{"course_id": client.course_id, "action": "star",
+                                                             "client_ts": 1}]})
+    assert response.status_code == 200
+    with app.app_context():
+        assert UserCoursePreference.query.filter_by(course_id=client.course_id).one().status == "star"